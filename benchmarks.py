@@ -0,0 +1,700 @@
+"""
+Замеры производительности голосового ассистента
+Запуск: python benchmarks.py <название замера> (список замеров - python benchmarks.py --help)
+"""
+import argparse  # разбор аргументов командной строки
+import array  # синтез тестовых фраз
+import collections  # очередь записей тестового микрофона
+import contextlib  # скрытие логов ассистента во время замеров
+import io  # скрытие логов ассистента во время замеров
+import json  # обмен результатами замеров с дочерним процессом, сохранение базовых результатов
+import math  # синтез тестовых фраз
+import os  # работа с файловой системой
+import random  # генерация синтетических фраз и команд
+import statistics  # медианы результатов замеров
+import subprocess  # замеры запуска в отдельном (чистом) процессе
+import sys  # путь к текущему интерпретатору
+import tempfile  # отдельные кэши для каждого замера
+import threading  # ожидание выполнения команд конвейером
+import time  # задержки тестовых сервисов и замеры времени фраз
+import timeit  # замеры времени выполнения небольших фрагментов кода
+import tracemalloc  # пиковое потребление памяти
+import types  # тестовые заменители модулей
+
+import finalproject
+
+
+def scan_commands_linearly(commands_table: dict, command_name: str):
+    """
+    Прежний способ поиска команды: перебор всех ключей таблицы для первого слова фразы
+    :return: список найденных обработчиков
+    """
+    handlers = []
+    for key in commands_table.keys():
+        if command_name in key:
+            handlers.append(commands_table[key])
+    return handlers
+
+
+def build_synthetic_commands(intents_count: int, keywords_per_intent: int = 5):
+    """
+    Построение таблицы команд заданного размера (реальные команды + синтетические)
+    :param intents_count: общее количество команд
+    :param keywords_per_intent: количество ключевых слов у каждой синтетической команды
+    """
+    commands_table = dict(finalproject.commands)
+    for intent in range(len(commands_table), intents_count):
+        keywords = tuple("".join(random.choice("абвгдеклмнопрстуя") for _ in range(random.randint(5, 12)))
+                         for _ in range(keywords_per_intent))
+        commands_table[keywords] = finalproject.toss_coin
+    return commands_table
+
+
+def benchmark_router(arguments):
+    """
+    Сравнение линейного перебора команд и индекса ключевых слов на таблицах разного размера
+    """
+    random.seed(0)
+    print("{:>8} {:>16} {:>16} {:>16}".format("intents", "linear scan, us", "router, us", "fuzzy router, us"))
+
+    for intents_count in arguments.sizes:
+        commands_table = build_synthetic_commands(intents_count)
+        router = finalproject.CommandRouter(commands_table)
+        keywords = [keyword for keys in commands_table for keyword in keys]
+
+        # фразы с ключевым словом в начале (прежний перебор видит только первое слово)
+        utterances = [[random.choice(keywords), "аргумент", "ещё"] for _ in range(arguments.utterances)]
+        # фразы с ошибкой распознавания в ключевом слове (нечётко сравниваются только достаточно длинные слова)
+        long_keywords = [keyword for keyword in keywords if len(keyword) >= 8]
+        misheard = [[random.choice(long_keywords)[:-1] + "ъ", "аргумент"] for _ in range(arguments.utterances)]
+
+        linear_time = timeit.timeit(
+            lambda: [scan_commands_linearly(commands_table, tokens[0]) for tokens in utterances], number=arguments.repeat)
+        router_time = timeit.timeit(
+            lambda: [router.match(tokens) for tokens in utterances], number=arguments.repeat)
+        # кэш нечёткого поиска сбрасывается перед каждой фразой, чтобы замерить поиск по индексу,
+        # а не попадания в кэш (в маленьких таблицах длинных ключевых слов мало, и опечатки в них повторяются)
+        fuzzy_time = timeit.timeit(
+            lambda: [router.find_similar_keyword.cache_clear() or router.match(tokens) for tokens in misheard],
+            number=arguments.repeat)
+
+        calls_count = arguments.repeat * arguments.utterances
+        print("{:>8} {:>16.2f} {:>16.2f} {:>16.2f}".format(
+            intents_count, linear_time / calls_count * 1e6, router_time / calls_count * 1e6,
+            fuzzy_time / calls_count * 1e6))
+
+
+# замеры запуска выполняются в отдельном процессе, где ещё ничего не импортировано
+STARTUP_SCRIPT = """
+import json, time
+start_time = time.perf_counter()
+import finalproject
+timings = {"import finalproject": time.perf_counter() - start_time}
+
+start_time = time.perf_counter()
+finalproject.Translation.load()
+timings["load translations"] = time.perf_counter() - start_time
+
+for lazy_module in finalproject.LazyModule.instances:
+    try:
+        lazy_module.load_module()
+        timings["import " + lazy_module.module_name] = finalproject.LazyModule.import_times[lazy_module.module_name]
+    except Exception:
+        timings["import " + lazy_module.module_name] = None
+
+for name, initialize in (("init speech_recognition.Recognizer", lambda: finalproject.speech_recognition.Recognizer()),
+                         ("init pyttsx3", lambda: finalproject.pyttsx3.init())):
+    start_time = time.perf_counter()
+    try:
+        initialize()
+        timings[name] = time.perf_counter() - start_time
+    except Exception:
+        timings[name] = None
+
+print(json.dumps(timings))
+"""
+
+
+def benchmark_startup(arguments):
+    """
+    Замер времени запуска с разбивкой по зависимостям (каждый запуск - в новом процессе)
+    """
+    if arguments.compile_translations:
+        finalproject.Translation.compile()
+
+    runs = []
+    for _ in range(arguments.runs):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True, check=True)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print("{:<45} {:>12}".format("stage", "median, ms"))
+    for stage in runs[0]:
+        timings = [run[stage] for run in runs if run[stage] is not None]
+        median = "{:.1f}".format(statistics.median(timings) * 1000) if timings else "unavailable"
+        print("{:<45} {:>12}".format(stage, median))
+
+
+class FakeMicrophone:
+    """
+    Тестовый микрофон: вместо записи отдаёт заранее подготовленные фразы по очереди
+    """
+    SAMPLE_RATE = 16000
+    SAMPLE_WIDTH = 2
+    CHUNK = 1024
+    ECHO_MARGIN = 0.01  # речь ассистента, закончившаяся незадолго до начала ожидания, тоже попадает в запись
+
+    def __init__(self, realtime: bool = False):
+        self.realtime = realtime  # ждать длительность фразы, как при настоящей записи
+        self.recordings = collections.deque()  # (кадры, фраза)
+        self.captured_times = collections.deque()  # моменты окончания записи фраз (для замера задержки)
+        self.listen_start_time = 0.0  # когда началось ожидание очередной фразы
+        self.listening = False  # запись ждёт начала фразы
+        self.hears_assistant = False  # речь ассистента тоже попадает в запись (как у открытого всё время микрофона)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeRecognizer:
+    """
+    Заменитель speech_recognition.Recognizer: запись - из тестового микрофона,
+    распознавание Google - поиск фразы по записи с заданной задержкой
+    """
+
+    def __init__(self, transcripts: dict, latency: float):
+        self.transcripts = transcripts  # кадры записи -> фраза
+        self.latency = latency
+        self.energy_threshold = 300
+        self.dynamic_energy_ratio = 1.5
+        self.pause_threshold = 0.8
+        self.non_speaking_duration = 0.5
+
+    def adjust_for_ambient_noise(self, source, duration: float = 1):
+        pass
+
+    def listen(self, source: FakeMicrophone, timeout=None, phrase_time_limit=None):
+        source.listen_start_time = time.perf_counter()
+        # как и настоящая запись, ожидание заканчивается, как только начинается фраза
+        deadline = time.perf_counter() + (timeout or 0.1)
+        source.listening = True
+        try:
+            while True:
+                # настоящий микрофон услышал бы речь ассистента: такую запись конвейер всё равно отбросит,
+                # поэтому ожидание фразы начинается заново (а фраза пользователя остаётся в очереди)
+                speech_heard = source.hears_assistant and (
+                    finalproject.speaking.is_set()
+                    or finalproject.SpeechQueue.speech_end_time > source.listen_start_time - FakeMicrophone.ECHO_MARGIN)
+                if speech_heard or time.perf_counter() >= deadline:
+                    time.sleep(0.001)
+                    raise FakeSpeechRecognition.WaitTimeoutError()
+                if source.recordings:
+                    break
+                time.sleep(0.001)
+        finally:
+            source.listening = False
+
+        frames, transcript = source.recordings.popleft()
+        if source.realtime:
+            time.sleep(len(frames) / (source.SAMPLE_RATE * source.SAMPLE_WIDTH))
+        source.captured_times.append(time.perf_counter())
+        return FakeSpeechRecognition.AudioData(frames, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+    def recognize_google(self, audio_data, language: str = "ru-RU"):
+        time.sleep(self.latency)
+        # после обрезки тишины запись - часть исходной фразы
+        frame_data = bytes(audio_data.frame_data)
+        for frames, transcript in self.transcripts.items():
+            if frames.find(frame_data) >= 0:
+                return transcript
+        raise FakeSpeechRecognition.UnknownValueError()
+
+
+class FakeSpeechRecognition:
+    """
+    Заменитель модуля speech_recognition
+    """
+
+    class AudioData:
+        def __init__(self, frame_data: bytes, sample_rate: int, sample_width: int):
+            self.frame_data = frame_data
+            self.sample_rate = sample_rate
+            self.sample_width = sample_width
+
+    class WaitTimeoutError(Exception):
+        pass
+
+    class UnknownValueError(Exception):
+        pass
+
+    class RequestError(Exception):
+        pass
+
+
+class FakeSpeechEngine:
+    """
+    Заменитель движка pyttsx3: ничего не произносит, озвучивание занимает заданное время
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.properties = {"voices": [types.SimpleNamespace(id="voice-" + str(index)) for index in range(3)],
+                           "voice": "voice-0"}
+        self.spoken = 0
+
+    def getProperty(self, name: str):
+        return self.properties[name]
+
+    def setProperty(self, name: str, value):
+        self.properties[name] = value
+
+    def say(self, text: str):
+        self.spoken += 1
+
+    def save_to_file(self, text: str, file_path: str):
+        pass
+
+    def runAndWait(self):
+        time.sleep(self.latency)
+
+    def stop(self):
+        pass
+
+
+def build_fake_modules(latencies: dict):
+    """
+    Заменители сетевых зависимостей навыков с заданными задержками
+    :param latencies: сервис -> задержка ответа в секундах
+    :return: название модуля -> заменитель
+    """
+    def search(query: str, **kwargs):
+        time.sleep(latencies["search"])
+        yield "https://example.com/search?q=" + query.replace(" ", "+")
+
+    class Translator:
+        def __init__(self, **kwargs):
+            pass
+
+        def translate(self, texts: list, src: str, dest: str):
+            time.sleep(latencies["translate"])
+            return [types.SimpleNamespace(text="[{}] {}".format(dest, text)) for text in texts]
+
+    class WikipediaResponse:
+        def __init__(self, title: str):
+            self.title = title
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"query": {"pages": [{
+                "title": self.title,
+                "fullurl": "https://example.com/wiki/" + self.title,
+                "extract": "{} is a test page. It has a short summary. And some more text.".format(self.title),
+            }]}}
+
+    class Session:
+        def __init__(self):
+            self.headers = {}
+
+        def get(self, url: str, params: dict = None, timeout: float = None):
+            time.sleep(latencies["wikipedia"])
+            return WikipediaResponse(params["titles"])
+
+    class Weather:
+        detailed_status = "clear sky"
+        pressure = {"press": 1013}
+
+        @staticmethod
+        def temperature(unit: str):
+            return {"temp": 12.5}
+
+        @staticmethod
+        def wind():
+            return {"speed": 3.0}
+
+    class WeatherManager:
+        @staticmethod
+        def weather_at_place(city_name: str):
+            time.sleep(latencies["weather"])
+            return types.SimpleNamespace(weather=Weather())
+
+    class OWM:
+        def __init__(self, api_key: str, config: dict = None):
+            pass
+
+        @staticmethod
+        def weather_manager():
+            return WeatherManager()
+
+    return {
+        "speech_recognition": FakeSpeechRecognition,
+        "pyttsx3": types.SimpleNamespace(init=lambda: FakeSpeechEngine(latencies["tts"])),
+        "googlesearch": types.SimpleNamespace(search=search),
+        "googletrans": types.SimpleNamespace(Translator=Translator),
+        "requests": types.SimpleNamespace(Session=Session),
+        "pyowm": types.SimpleNamespace(OWM=OWM),
+        "pyowm.utils.config": types.SimpleNamespace(get_default_config=lambda: {"connection": {}}),
+    }
+
+
+# фразы сценария по умолчанию (навык определяется по ключевому слову)
+DEFAULT_UTTERANCES = [
+    "привет",
+    "подбрось монету",
+    "погода",
+    "погода москва",
+    "определение python",
+    "определение липецк",
+    "определение вольт",
+    "переведи cat",
+    "переведи dog and house",
+    "найди рецепт блинов",
+    "видео котики",
+]
+
+
+def synthesize_utterance(index: int, duration: float = 1.0, pause: float = 0.5, sample_rate: int = 16000):
+    """
+    Синтез тестовой фразы: тон (своей частоты для каждой фразы) с тихим шумом до и после него
+    :return: 16-битные моно-кадры
+    """
+    generator = random.Random(index)
+    frequency = 200 + 15 * index
+    samples = array.array("h", [generator.randint(-40, 40) for _ in range(int(pause * sample_rate))])
+    samples.extend(int(8000 * math.sin(2 * math.pi * frequency * sample / sample_rate))
+                   for sample in range(int(duration * sample_rate)))
+    samples.extend(generator.randint(-40, 40) for _ in range(int(pause * sample_rate)))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def load_fixtures(fixtures_directory: str):
+    """
+    Загрузка записанных фраз: wav-файлы из каталога и transcripts.json с их текстом ({"файл.wav": "фраза"})
+    :return: список пар (кадры 16 кГц моно, фраза)
+    """
+    if not fixtures_directory:
+        return [(synthesize_utterance(index), utterance) for index, utterance in enumerate(DEFAULT_UTTERANCES)]
+
+    with open(os.path.join(fixtures_directory, "transcripts.json"), "r", encoding="UTF-8") as file:
+        transcripts = json.load(file)
+    fixtures = []
+    for file_name, transcript in sorted(transcripts.items()):
+        audio_buffer = finalproject.read_wav_file(os.path.join(fixtures_directory, file_name))
+        fixtures.append((finalproject.convert_audio(audio_buffer, FakeMicrophone.SAMPLE_RATE).to_bytes(), transcript))
+    return fixtures
+
+
+def setup_fake_environment(arguments, fixtures: list, cache_directory: str):
+    """
+    Подготовка ассистента так же, как в __main__, но с тестовыми микрофоном, распознаванием, синтезом и сервисами
+    :return: тестовый микрофон
+    """
+    fake_modules = build_fake_modules(arguments.latency)
+    for lazy_module in finalproject.LazyModule.instances:
+        if lazy_module.module_name in fake_modules:
+            lazy_module.loaded_module = fake_modules[lazy_module.module_name]
+    finalproject.webbrowser = types.SimpleNamespace(get=lambda: types.SimpleNamespace(open=lambda url: True))
+    finalproject.get_voice_id.cache_clear()
+    finalproject.get_available_voices.cache_clear()
+
+    owner_person = finalproject.OwnerPerson()
+    owner_person.name, owner_person.home_city = "Matvey", "Lipetsk"
+    owner_person.native_language, owner_person.target_language = "ru", "en"
+    assistant_settings = finalproject.VoiceAssistant()
+    assistant_settings.name, assistant_settings.sex, assistant_settings.speech_language = "Alice", "female", "ru"
+    finalproject.default_session = finalproject.AssistantSession(owner_person, assistant_settings)
+
+    microphone = FakeMicrophone(arguments.realtime)
+    finalproject.microphone = microphone
+    finalproject.recognizer = FakeRecognizer(dict(fixtures), arguments.latency["google"])
+    finalproject.noise_estimator = finalproject.NoiseEstimator(finalproject.recognizer)
+    finalproject.voice_activity_detector = finalproject.VoiceActivityDetector(finalproject.recognizer)
+    finalproject.ttsEngine = finalproject.pyttsx3.init()
+    finalproject.setup_assistant_voice()
+
+    # моделей Vosk нет: распознавание во время записи не используется, Google всегда доступен
+    finalproject.vosk_models = finalproject.VoskModelRegistry(os.path.join(cache_directory, "models"))
+    finalproject.recognition_strategy = finalproject.RecognitionStrategy(assistant_settings.recognition_mode)
+    finalproject.translator = finalproject.Translation()
+    finalproject.speech_cache = finalproject.SpeechCache(os.path.join(cache_directory, "speech"))
+    finalproject.speech_cache.enabled = False  # воспроизведение через PyAudio недоступно
+    finalproject.weather_service = finalproject.WeatherService("benchmark",
+                                                               cache_file=os.path.join(cache_directory, "weather.json"))
+    finalproject.wikipedia_summaries = finalproject.WikipediaSummaries(
+        finalproject.PersistentCache(os.path.join(cache_directory, "wikipedia.sqlite3")))
+    finalproject.text_translator = finalproject.TextTranslator(
+        finalproject.PersistentCache(os.path.join(cache_directory, "translations.sqlite3")))
+    return microphone
+
+
+def get_skill_name(transcript: str):
+    command_match = finalproject.command_router.match(transcript.split(" "))
+    return command_match.handler.__name__ if command_match is not None else "unknown"
+
+
+def summarize_turns(latencies: list, elapsed_time: float, failed_turns: int = 0, peak_memory: int = None):
+    """
+    Сводка по фразам: пропускная способность, квантили задержки, пиковая память
+    и количество фраз без выполненной команды (отброшены VAD, не распознаны или не дождались ответа)
+    """
+    if len(latencies) > 1:
+        quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    else:
+        quantiles = (latencies or [0.0]) * 99
+    return {
+        "turns": len(latencies),
+        "failed_turns": failed_turns,
+        "turns_per_second": len(latencies) / elapsed_time if elapsed_time else 0.0,
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+        "peak_memory": peak_memory,
+    }
+
+
+def run_sequential_turns(microphone: FakeMicrophone, fixtures: list, turns: int):
+    """
+    Выполнение фраз так же, как основной цикл __main__ без конвейера (запись, распознавание, выполнение)
+    :return: задержки выполненных фраз, общее время и количество фраз без команды
+    """
+    latencies, failed_turns = [], 0
+    start_time = time.perf_counter()
+    for turn in range(turns):
+        microphone.recordings.append(fixtures[turn % len(fixtures)])
+        turn_start = time.perf_counter()
+        voice_input = finalproject.record_and_recognize_audio()
+        if not voice_input:
+            failed_turns += 1
+            continue
+        finalproject.execute_command(voice_input)
+        latencies.append(time.perf_counter() - turn_start)
+    return latencies, time.perf_counter() - start_time, failed_turns
+
+
+# сколько секунд конвейер может обрабатывать одну фразу, прежде чем она будет считаться неудачной
+PIPELINE_TURN_TIMEOUT = 30
+
+
+def run_pipeline_turns(microphone: FakeMicrophone, fixtures: list, turns: int):
+    """
+    Выполнение фраз через конвейер ассистента (задержка - от окончания записи до выполнения команды).
+    Следующая фраза звучит сразу после записи предыдущей (пока команда ждёт сетевой сервис), но не во время
+    озвучивания ответа: такие фразы конвейер отбрасывает как речь самого ассистента
+    :return: задержки выполненных фраз, общее время и количество фраз без команды
+    """
+    latencies, failed_turns = [], 0
+    captured_times = []  # номер фразы -> момент окончания её записи
+    recognized_turns = collections.deque()  # номера распознанных фраз в порядке очереди команд
+    turns_resolved = threading.Condition()
+    resolved = [0]
+    capture_audio, execute_command = finalproject.capture_audio, finalproject.execute_command
+    recognize_audio = finalproject.recognize_audio
+
+    def resolve(latency: float = None):
+        nonlocal failed_turns
+        with turns_resolved:
+            if latency is None:
+                failed_turns += 1
+            else:
+                latencies.append(latency)
+            resolved[0] += 1
+            turns_resolved.notify_all()
+
+    def capture_and_number(*args, **kwargs):
+        # тестовый микрофон отдаёт фразы по очереди, поэтому номер фразы - номер записи
+        audio_buffer = capture_audio(*args, **kwargs)
+        if audio_buffer is not None:
+            audio_buffer.turn = len(captured_times)
+            captured_times.append(microphone.captured_times.popleft())
+        return audio_buffer
+
+    def recognize_and_check(audio_buffer):
+        try:
+            voice_input = recognize_audio(audio_buffer)
+        except:
+            resolve()
+            raise
+        if voice_input:
+            recognized_turns.append(audio_buffer.turn)
+        else:
+            resolve()  # фраза отброшена VAD или не распознана - команды не будет
+        return voice_input
+
+    def execute_and_check(voice_input: str):
+        turn = recognized_turns.popleft()
+        try:
+            execute_command(voice_input)
+        finally:
+            resolve(time.perf_counter() - captured_times[turn])
+
+    pipeline = finalproject.AssistantPipeline()
+    finalproject.capture_audio, finalproject.execute_command = capture_and_number, execute_and_check
+    finalproject.recognize_audio = recognize_and_check
+    microphone.captured_times.clear()
+    microphone.hears_assistant = True
+    try:
+        start_time = time.perf_counter()
+        pipeline.start()
+        for turn in range(turns):
+            # пользователь не начинает фразу, пока не записана предыдущая и пока говорит ассистент
+            # (фраза начинается, когда микрофон снова ждёт фразу после ответа)
+            while ((microphone.recordings or not microphone.listening or finalproject.speaking.is_set()
+                    or microphone.listen_start_time - FakeMicrophone.ECHO_MARGIN
+                    <= finalproject.SpeechQueue.speech_end_time)
+                   and not pipeline.stopped.is_set()):
+                time.sleep(0.001)
+            microphone.recordings.append(fixtures[turn % len(fixtures)])
+
+        # фраза без команды - отброшенная конвейером, не распознанная или не выполненная за отведённое время
+        with turns_resolved:
+            turns_resolved.wait_for(lambda: resolved[0] + pipeline.dropped >= turns, PIPELINE_TURN_TIMEOUT)
+            failed_turns += turns - resolved[0]
+        elapsed_time = time.perf_counter() - start_time
+    finally:
+        pipeline.stopped.set()
+        for thread in pipeline.threads:
+            thread.join()
+        microphone.recordings.clear()
+        microphone.hears_assistant = False
+        finalproject.capture_audio, finalproject.execute_command = capture_audio, execute_command
+        finalproject.recognize_audio = recognize_audio
+    return latencies, elapsed_time, failed_turns
+
+
+def measure(run_turns, microphone: FakeMicrophone, fixtures: list, turns: int):
+    """
+    Замер задержек (без отслеживания памяти) и отдельный прогон с отслеживанием пиковой памяти
+    """
+    latencies, elapsed_time, failed_turns = run_turns(microphone, fixtures, turns)
+    tracemalloc.start()
+    try:
+        run_turns(microphone, fixtures, max(1, turns // 4))
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarize_turns(latencies, elapsed_time, failed_turns, peak_memory)
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float):
+    """
+    Сравнение результатов с сохранёнными базовыми
+    :param tolerance: допустимое ухудшение (доля)
+    :return: список ухудшений, превысивших допустимое
+    """
+    regressions = []
+    print("\n{:<40} {:<17} {:>12} {:>12} {:>9}".format("scenario", "metric", "baseline", "current", "change"))
+    for scenario, current in results.items():
+        for metric, higher_is_better in (("turns_per_second", True), ("p50", False), ("p95", False), ("p99", False),
+                                         ("peak_memory", False)):
+            baseline_value = baseline.get(scenario, {}).get(metric)
+            if not baseline_value or current.get(metric) is None:
+                continue
+            change = current[metric] / baseline_value - 1
+            regressed = -change > tolerance if higher_is_better else change > tolerance
+            if regressed:
+                regressions.append((scenario, metric))
+            print("{:<40} {:<17} {:>12.4g} {:>12.4g} {:>+8.1f}%{}".format(
+                scenario, metric, baseline_value, current[metric], change * 100, "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def benchmark_end_to_end(arguments):
+    """
+    Замер полного цикла ассистента (запись, распознавание, поиск команды, навык, синтез речи)
+    с тестовыми микрофоном, распознаванием, синтезом и сервисами с заданными задержками
+    """
+    random.seed(0)
+    fixtures = load_fixtures(arguments.fixtures)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as cache_directory:
+        microphone = setup_fake_environment(arguments, fixtures, cache_directory)
+
+        # логи ассистента не смешиваются с результатами замеров
+        with contextlib.redirect_stdout(io.StringIO()):
+            skills = collections.OrderedDict()
+            for fixture in fixtures:
+                skills.setdefault(get_skill_name(fixture[1]), []).append(fixture)
+            for skill_name, skill_fixtures in skills.items():
+                results["skill:" + skill_name] = measure(run_sequential_turns, microphone, skill_fixtures,
+                                                         arguments.turns)
+            results["loop:sequential"] = measure(run_sequential_turns, microphone, fixtures, arguments.turns)
+            results["loop:pipeline"] = measure(run_pipeline_turns, microphone, fixtures, arguments.turns)
+
+    print("{:<40} {:>7} {:>7} {:>10} {:>10} {:>10} {:>10} {:>12}".format(
+        "scenario", "turns", "failed", "turns/s", "p50, ms", "p95, ms", "p99, ms", "peak, KiB"))
+    for scenario, summary in results.items():
+        print("{:<40} {:>7} {:>7} {:>10.2f} {:>10.1f} {:>10.1f} {:>10.1f} {:>12.1f}".format(
+            scenario, summary["turns"], summary["failed_turns"], summary["turns_per_second"],
+            summary["p50"] * 1000, summary["p95"] * 1000, summary["p99"] * 1000, summary["peak_memory"] / 1024))
+
+    if arguments.output:
+        with open(arguments.output, "w", encoding="UTF-8") as file:
+            json.dump({"latency": arguments.latency, "realtime": arguments.realtime, "turns": arguments.turns,
+                       "results": results, "stages": finalproject.stage_metrics.get_stats()},
+                      file, ensure_ascii=False, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline, "r", encoding="UTF-8") as file:
+            baseline = json.load(file)
+        if (baseline.get("latency"), baseline.get("realtime")) != (arguments.latency, arguments.realtime):
+            print("\nWarning: baseline was measured with different service latencies or realtime capture")
+        regressions = compare_with_baseline(results, baseline["results"], arguments.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+def parse_latencies(values: list):
+    """
+    Разбор задержек тестовых сервисов вида "google=0.3"
+    """
+    latencies = {"google": 0.05, "search": 0.1, "translate": 0.05, "wikipedia": 0.1, "weather": 0.1, "tts": 0.0}
+    for value in values:
+        service, _, latency = value.partition("=")
+        if service not in latencies:
+            raise argparse.ArgumentTypeError("unknown service: " + service)
+        latencies[service] = float(latency)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры производительности голосового ассистента")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+
+    router_parser = benchmarks.add_parser("router", help="поиск команды в распознанной фразе")
+    router_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500, 1000])
+    router_parser.add_argument("--utterances", type=int, default=1000)
+    router_parser.add_argument("--repeat", type=int, default=20)
+    router_parser.set_defaults(run=benchmark_router)
+
+    startup_parser = benchmarks.add_parser("startup", help="время запуска с разбивкой по зависимостям")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--compile-translations", action="store_true",
+                                help="замерить загрузку подготовленной таблицы переводов")
+    startup_parser.set_defaults(run=benchmark_startup)
+
+    end_to_end_parser = benchmarks.add_parser("e2e", help="полный цикл ассистента с тестовыми микрофоном, "
+                                                         "распознаванием, синтезом речи и сервисами")
+    end_to_end_parser.add_argument("--turns", type=int, default=40, help="количество фраз в каждом сценарии")
+    end_to_end_parser.add_argument("--fixtures", default="",
+                                   help="каталог с wav-файлами и transcripts.json (по умолчанию - синтезированные фразы)")
+    end_to_end_parser.add_argument("--latency", nargs="*", default=[], metavar="SERVICE=SECONDS",
+                                   help="задержки сервисов: google, search, translate, wikipedia, weather, tts")
+    end_to_end_parser.add_argument("--realtime", action="store_true",
+                                   help="запись фразы длится столько же, сколько сама фраза")
+    end_to_end_parser.add_argument("--output", default="", help="JSON-файл для результатов (можно использовать "
+                                                                "как базовые результаты)")
+    end_to_end_parser.add_argument("--baseline", default="", help="JSON-файл с базовыми результатами для сравнения")
+    end_to_end_parser.add_argument("--tolerance", type=float, default=0.1,
+                                   help="допустимое ухудшение относительно базовых результатов (доля)")
+    end_to_end_parser.set_defaults(run=benchmark_end_to_end)
+
+    parsed_arguments = parser.parse_args()
+    if parsed_arguments.benchmark == "e2e":
+        parsed_arguments.latency = parse_latencies(parsed_arguments.latency)
+    parsed_arguments.run(parsed_arguments)
@@ -1,26 +1,149 @@
-from vosk import Model, KaldiRecognizer  # оффлайн-распознавание от Vosk
-from googlesearch import search  # поиск в Google
-from pyowm import OWM  # использование OpenWeatherMap для получения данных о погоде
 from termcolor import colored  # вывод цветных логов (для выделения распознанной речи)
 from dotenv import load_dotenv  # загрузка информации из .env-файла
-import speech_recognition  # распознавание пользовательской речи (Speech-To-Text)
-import googletrans  # использование системы Google Translate
-import pyttsx3  # синтез речи (Text-To-Speech)
-import wikipediaapi  # поиск определений в Wikipedia
 import random  # генератор случайных чисел
 import webbrowser  # работа с использованием браузера по умолчанию (открывание вкладок с web-страницей)
 import traceback  # вывод traceback без остановки работы программы при отлове исключений
 import json  # работа с json-файлами и json-строками
+import argparse  # разбор аргументов командной строки
+import atexit  # сохранение метрик и времён обращения к кэшу при выходе
+import bisect  # поиск интервала гистограммы задержек
+import collections  # упорядоченный словарь для вытеснения давно не использованных записей кэша
+import hashlib  # имена файлов кэша синтезированной речи
+import importlib  # отложенный импорт тяжёлых зависимостей
+import importlib.util  # проверка наличия необязательных зависимостей без их импорта
+import marshal  # быстрая загрузка заранее подготовленной таблицы переводов
+import sqlite3  # постоянный кэш ответов сетевых сервисов на диске
+import string  # поиск подставляемых значений в шаблонах фраз
+import concurrent.futures  # пул потоков для сетевых навыков
+import contextlib  # замеры времени этапов через with
+import contextvars  # текущая сессия пользователя (своя для каждого запроса к серверу)
+import http.server  # локальный сервер для обслуживания нескольких пользователей
+import io  # чтение wav-файлов, присланных на сервер, из памяти
+import uuid  # идентификаторы сессий
+import functools  # кэширование результатов нечёткого поиска команд
+import queue  # очереди между этапами конвейера (запись, распознавание, выполнение команд)
 import wave  # создание и чтение аудиофайлов формата wav
 import os  # работа с файловой системой
+import statistics  # медиана энергии шумов между фразами
+import sys  # версия интерпретатора (для имени файла подготовленной таблицы переводов)
+import threading  # фоновая загрузка моделей и защита общих ресурсов от гонок
+import time  # замеры времени работы (загрузка моделей и т.д.)
+
+try:
+    import audioop  # расчёт энергии сигнала без NumPy (используется и самим speech_recognition)
+except ImportError:
+    audioop = None
+
+
+class LazyModule:
+    """
+    Модуль, который импортируется только при первом обращении к его атрибутам
+    (тяжёлые зависимости навыков не замедляют запуск ассистента)
+    """
+    instances = []  # все отложенные модули (для замеров времени запуска)
+    import_times = {}  # название модуля -> время импорта в секундах
+
+    def __init__(self, module_name: str):
+        self.module_name = module_name
+        self.loaded_module = None
+        LazyModule.instances.append(self)
+
+    def load_module(self):
+        """
+        Импорт модуля (выполняется один раз)
+        :return: импортированный модуль
+        """
+        if self.loaded_module is None:
+            start_time = time.perf_counter()
+            loaded_module = importlib.import_module(self.module_name)
+            LazyModule.import_times.setdefault(self.module_name, time.perf_counter() - start_time)
+            self.loaded_module = loaded_module
+        return self.loaded_module
+
+    def is_module_available(self):
+        """
+        Проверка наличия модуля без его импорта (для необязательных зависимостей)
+        """
+        try:
+            return importlib.util.find_spec(self.module_name) is not None
+        except (ImportError, ValueError):
+            return False
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.load_module(), attribute)
+
+
+vosk = LazyModule("vosk")  # оффлайн-распознавание от Vosk
+googlesearch = LazyModule("googlesearch")  # поиск в Google
+pyowm = LazyModule("pyowm")  # использование OpenWeatherMap для получения данных о погоде
+pyowm_config = LazyModule("pyowm.utils.config")  # настройки клиента OpenWeatherMap (таймауты соединения)
+speech_recognition = LazyModule("speech_recognition")  # распознавание пользовательской речи (Speech-To-Text)
+googletrans = LazyModule("googletrans")  # использование системы Google Translate
+pyttsx3 = LazyModule("pyttsx3")  # синтез речи (Text-To-Speech)
+requests = LazyModule("requests")  # HTTP-запросы к Wikipedia с переиспользованием соединений
+numpy = LazyModule("numpy")  # векторизованный расчёт энергии сигнала (необязательная зависимость)
 
 
 class Translation:
     """
-    Получение вшитого в приложение перевода строк для создания мультиязычного ассистента
+    Получение вшитого в приложение перевода строк для создания мультиязычного ассистента.
+    Таблица переводов загружается при первом обращении и хранится в виде словаря для каждого языка
     """
-    with open("translations.json", "r", encoding="UTF-8") as file:
-        translations = json.load(file)
+    source_file = "translations.json"
+    compiled_file = os.path.join("cache", "translations." + sys.implementation.cache_tag + ".marshal")
+    translations = None  # язык -> {фраза: перевод}
+    lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        """
+        Загрузка таблицы переводов (из подготовленного файла, если он не старше translations.json)
+        :return: словарь переводов для каждого языка
+        """
+        if cls.translations is None:
+            with cls.lock:
+                if cls.translations is None:
+                    cls.translations = cls.load_compiled() or cls.load_source()
+        return cls.translations
+
+    @classmethod
+    def load_source(cls):
+        """
+        Чтение translations.json и преобразование его в словари переводов для каждого языка
+        """
+        with open(cls.source_file, "r", encoding="UTF-8") as file:
+            source_translations = json.load(file)
+
+        translations = {}
+        for text, text_translations in source_translations.items():
+            for language, translation in text_translations.items():
+                translations.setdefault(language, {})[text] = translation
+        return translations
+
+    @classmethod
+    def load_compiled(cls):
+        """
+        Чтение подготовленной таблицы переводов
+        :return: словарь переводов или None, если файла нет или он устарел
+        """
+        try:
+            if os.path.getmtime(cls.compiled_file) < os.path.getmtime(cls.source_file):
+                return None
+            with open(cls.compiled_file, "rb") as file:
+                return marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    @classmethod
+    def compile(cls):
+        """
+        Подготовка таблицы переводов в формате marshal (загружается быстрее, чем json)
+        """
+        translations = cls.load_source()
+        os.makedirs(os.path.dirname(cls.compiled_file), exist_ok=True)
+        with open(cls.compiled_file, "wb") as file:
+            marshal.dump(translations, file)
+        cls.translations = translations
 
     def get(self, text: str):
         """
@@ -28,13 +151,22 @@ class Translation:
         :param text: текст, который требуется перевести
         :return: вшитый в приложение перевод текста
         """
-        if text in self.translations:
-            return self.translations[text][assistant.speech_language]
+        language_translations = self.load().get(assistant.speech_language, {})
+        if text in language_translations:
+            return language_translations[text]
         else:
             # в случае отсутствия перевода происходит вывод сообщения об этом в логах и возврат исходного текста
             print(colored("Not translated phrase: {}".format(text), "red"))
             return text
 
+    def get_all(self, language: str):
+        """
+        Получение всех вшитых в приложение фраз на нужном языке
+        :param language: код языка
+        :return: список переведённых фраз
+        """
+        return [translation for translation in self.load().get(language, {}).values() if translation.strip()]
+
 
 class OwnerPerson:
     """
@@ -54,129 +186,1992 @@ class VoiceAssistant:
     sex = ""
     speech_language = ""
     recognition_language = ""
+    debug_audio_file = ""  # путь для сохранения последней записи в wav (пустая строка - запись не сохраняется)
+    use_pipeline = True  # запись, распознавание и выполнение команд в отдельных потоках
+    streaming_recognition = True  # распознавание Vosk во время записи (если модель для языка скачана)
+    recognition_mode = "prefer_online"  # выбор между Google и Vosk: "fallback", "race" или "prefer_online"
+    barge_in = False  # прерывание речи ассистента новой фразой пользователя (лучше включать с гарнитурой)
 
 
-def setup_assistant_voice():
+class AssistantSession:
+    """
+    Сессия пользователя: данные владельца, настройки ассистента и ответы на текущую команду.
+    Распознаватели, кэши и пулы навыков общие для всех сессий
+    """
+
+    def __init__(self, owner: OwnerPerson, assistant_settings: VoiceAssistant, speak_locally: bool = True):
+        self.session_id = uuid.uuid4().hex
+        self.owner = owner
+        self.assistant = assistant_settings
+        self.speak_locally = speak_locally  # озвучивать ответы через динамики или накапливать их для клиента
+        self.voice_language = ""  # язык голоса, которым сейчас произносятся ответы
+        self.replies = []  # ответы на текущую команду (для сессий без локального озвучивания)
+        self.closed = False
+        self.last_activity = time.monotonic()
+        self.lock = threading.Lock()  # команды одной сессии выполняются по очереди
+
+    def run(self, function, *args):
+        """
+        Выполнение функции от имени сессии (модульные assistant и person указывают на данные этой сессии)
+        :return: результат функции
+        """
+        with self.lock:
+            self.last_activity = time.monotonic()
+            token = current_session.set(self)
+            try:
+                return function(*args)
+            finally:
+                current_session.reset(token)
+
+    def add_reply(self, text: str):
+        """
+        Сохранение ответа ассистента для отправки клиенту
+        """
+        self.replies.append({"text": text, "language": self.voice_language or self.assistant.speech_language})
+
+    def close(self):
+        self.closed = True
+
+
+# сессия, от имени которой выполняется текущий код (по умолчанию - сессия локального пользователя)
+current_session = contextvars.ContextVar("current_session", default=None)
+default_session = None
+
+
+def get_session():
     """
-    Установка голоса по умолчанию (индекс может меняться в зависимости от настроек операционной системы)
+    Получение текущей сессии пользователя
     """
-    voices = ttsEngine.getProperty("voices")
+    return current_session.get() or default_session
+
+
+class SessionAttributeProxy:
+    """
+    Обращение к данным текущей сессии через модульные переменные assistant и person
+    (навыки работают с ними так же, как раньше, но у каждого пользователя свои данные)
+    """
+
+    def __init__(self, session_attribute: str):
+        object.__setattr__(self, "session_attribute", session_attribute)
+
+    def __getattr__(self, attribute: str):
+        return getattr(getattr(get_session(), self.session_attribute), attribute)
+
+    def __setattr__(self, attribute: str, value):
+        setattr(getattr(get_session(), self.session_attribute), attribute, value)
+
+
+assistant = SessionAttributeProxy("assistant")
+person = SessionAttributeProxy("owner")
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с фиксированными интервалами (как гистограммы Prometheus): запись значения -
+    поиск интервала и увеличение счётчика, поэтому её можно обновлять на каждом этапе каждой фразы
+    """
+
+    # верхние границы интервалов в секундах
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
 
-    if assistant.speech_language == "en":
-        assistant.recognition_language = "en-US"
-        if assistant.sex == "female":
+    def __init__(self, buckets: tuple = default_buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последний интервал - значения больше всех границ
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        """
+        Запись одного замера
+        :param value: длительность в секундах
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def get_quantile(self, quantile: float):
+        """
+        Оценка квантиля по интервалам гистограммы (линейная интерполяция внутри интервала)
+        :param quantile: квантиль от 0 до 1
+        :return: оценка в секундах (0, если замеров ещё нет)
+        """
+        with self.lock:
+            counts, count, maximum = list(self.counts), self.count, self.max
+        if count == 0:
+            return 0.0
+
+        rank, cumulative = quantile * count, 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else maximum
+                return min(maximum, lower + (upper - lower) * (rank - cumulative) / bucket_count)
+            cumulative += bucket_count
+        return maximum
+
+    def get_stats(self):
+        """
+        Получение счётчиков и оценок квантилей
+        """
+        with self.lock:
+            stats = {"count": self.count, "sum": self.sum, "max": self.max,
+                     "buckets": dict(zip([str(bucket) for bucket in self.buckets] + ["+Inf"], self.counts))}
+        stats.update({"p50": self.get_quantile(0.5), "p95": self.get_quantile(0.95), "p99": self.get_quantile(0.99)})
+        return stats
+
+
+class StageMetrics:
+    """
+    Задержки этапов обработки фразы (запись, распознавание, поиск команды, навыки, синтез речи)
+    и счётчики компонентов ассистента с выгрузкой в JSON-файл или в текстовом формате Prometheus
+    """
+
+    def __init__(self):
+        self.histograms = {}  # название этапа -> гистограмма задержек
+        self.stats_providers = {}  # название компонента -> функция получения его счётчиков (get_stats)
+        self.lock = threading.Lock()
+
+    def register_stats(self, component: str, provider):
+        """
+        Добавление счётчиков компонента в выгрузку метрик
+        :param component: название компонента
+        :param provider: функция без аргументов, возвращающая словарь счётчиков
+        """
+        with self.lock:
+            self.stats_providers[component] = provider
+
+    def get_component_stats(self):
+        """
+        Получение счётчиков всех зарегистрированных компонентов (ошибка одного компонента не мешает остальным)
+        """
+        with self.lock:
+            providers = dict(self.stats_providers)
+        component_stats = {}
+        for component, provider in sorted(providers.items()):
+            try:
+                component_stats[component] = provider()
+            except:
+                traceback.print_exc()
+        return component_stats
+
+    def get_report(self):
+        """
+        Получение всех метрик: задержки этапов и счётчики компонентов
+        """
+        return {"time": time.time(), "stages": self.get_stats(), "components": self.get_component_stats()}
+
+    def get_histogram(self, stage: str):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        return histogram
+
+    def observe(self, stage: str, elapsed_time: float):
+        """
+        Запись длительности этапа
+        :param stage: название этапа
+        :param elapsed_time: длительность в секундах
+        """
+        self.get_histogram(stage).observe(elapsed_time)
+
+    @contextlib.contextmanager
+    def timed(self, stage: str):
+        """
+        Замер длительности блока with (длительность записывается, даже если в блоке возникло исключение)
+        :param stage: название этапа
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start_time)
+
+    def get_stats(self):
+        """
+        Получение статистики всех этапов
+        """
+        with self.lock:
+            histograms = dict(self.histograms)
+        return {stage: histogram.get_stats() for stage, histogram in sorted(histograms.items())}
+
+    def save(self, file_path: str):
+        """
+        Сохранение метрик в JSON-файл (через временный файл, чтобы читатель не увидел файл наполовину)
+        :param file_path: путь к файлу
+        """
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        temporary_file = file_path + ".tmp"
+        with open(temporary_file, "w", encoding="UTF-8") as file:
+            json.dump(self.get_report(), file, ensure_ascii=False, indent=2)
+        os.replace(temporary_file, file_path)
+
+    def save_periodically(self, file_path: str, interval: float = 60):
+        """
+        Периодическое сохранение метрик в фоне и при выходе из программы
+        :param file_path: путь к файлу
+        :param interval: период сохранения в секундах
+        """
+        def save_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save(file_path)
+                except:
+                    traceback.print_exc()
+
+        atexit.register(self.save, file_path)
+        threading.Thread(target=save_loop, name="metrics_writer", daemon=True).start()
+
+    def to_prometheus(self):
+        """
+        Метрики в текстовом формате Prometheus (гистограмма assistant_stage_duration_seconds с меткой stage)
+        """
+        lines = ["# HELP assistant_stage_duration_seconds Duration of voice assistant processing stages.",
+                 "# TYPE assistant_stage_duration_seconds histogram"]
+        with self.lock:
+            histograms = dict(self.histograms)
+
+        for stage, histogram in sorted(histograms.items()):
+            with histogram.lock:
+                counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+            stage_label = self.escape_label(stage)
+            cumulative = 0
+            for bucket, bucket_count in zip([repr(bucket) for bucket in histogram.buckets] + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append('assistant_stage_duration_seconds_bucket{{stage="{}",le="{}"}} {}'.format(
+                    stage_label, bucket, cumulative))
+            lines.append('assistant_stage_duration_seconds_sum{{stage="{}"}} {}'.format(stage_label, repr(total)))
+            lines.append('assistant_stage_duration_seconds_count{{stage="{}"}} {}'.format(stage_label, count))
+
+        # числовые счётчики компонентов (вложенные словари разворачиваются в названия через точку)
+        lines += ["# HELP assistant_component_stat Counters reported by voice assistant components.",
+                  "# TYPE assistant_component_stat gauge"]
+        for component, component_stats in self.get_component_stats().items():
+            for stat, value in self.flatten_stats(component_stats):
+                lines.append('assistant_component_stat{{component="{}",stat="{}"}} {}'.format(
+                    self.escape_label(component), self.escape_label(stat), repr(float(value))))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def escape_label(value: str):
+        return value.replace("\\", "\\\\").replace('"', '\\"')
+
+    @classmethod
+    def flatten_stats(cls, stats: dict, prefix: str = ""):
+        """
+        Получение числовых счётчиков из вложенного словаря
+        :return: список пар (название через точку, значение)
+        """
+        flat_stats = []
+        for name, value in stats.items():
+            if isinstance(value, dict):
+                flat_stats.extend(cls.flatten_stats(value, prefix + str(name) + "."))
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                flat_stats.append((prefix + str(name), value))
+        return flat_stats
+
+
+class SlowTurnProfiler:
+    """
+    Выборочный профилировщик медленных фраз: пока обрабатывается фраза, фоновый поток периодически снимает
+    стеки вызовов потоков, участвующих в обработке, и если фраза обрабатывалась дольше порога,
+    самые частые стеки выводятся в лог и сохраняются в файл
+    """
+
+    def __init__(self, threshold: float = 0.0, interval: float = 0.01, top_stacks: int = 5,
+                 report_file: str = os.path.join("cache", "slow_turns.jsonl")):
+        self.threshold = threshold  # порог длительности фразы в секундах (0 - профилировщик выключен)
+        self.interval = interval  # период снятия стеков в секундах
+        self.top_stacks = top_stacks
+        self.report_file = report_file
+        self.watched_threads = collections.Counter()  # идентификатор потока -> сколько раз он отслеживается
+        self.active_turns = 0
+        self.sampler_stopped = None  # событие остановки текущего потока снятия стеков (у каждого потока своё)
+        self.stacks = collections.Counter()  # свёрнутый стек -> количество попаданий
+        self.samples = 0
+        self.slow_turns = 0
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def watch(self):
+        """
+        Отслеживание текущего потока, пока выполняется блок with (например, поток навыка из пула)
+        """
+        if not self.threshold:
+            yield
+            return
+
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.watched_threads[thread_id] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.watched_threads[thread_id] -= 1
+                if not self.watched_threads[thread_id]:
+                    del self.watched_threads[thread_id]
+
+    @contextlib.contextmanager
+    def profile(self, turn: str):
+        """
+        Профилирование обработки одной фразы (стеки снимаются, только пока обрабатывается хотя бы одна фраза)
+        :param turn: распознанная фраза (для отчёта)
+        """
+        if not self.threshold:
+            yield
+            return
+
+        with self.lock:
+            self.active_turns += 1
+            if self.active_turns == 1:
+                self.stacks.clear()
+                self.samples = 0
+                # новое событие для каждого потока: остановка прежнего потока не отменяется запуском нового
+                self.sampler_stopped = threading.Event()
+                threading.Thread(target=self.sample_loop, args=(self.sampler_stopped,), name="turn_profiler",
+                                 daemon=True).start()
+
+        start_time = time.perf_counter()
+        try:
+            with self.watch():
+                yield
+        finally:
+            elapsed_time = time.perf_counter() - start_time
+            with self.lock:
+                self.active_turns -= 1
+                if not self.active_turns:
+                    self.sampler_stopped.set()
+                stacks, samples = self.stacks.most_common(self.top_stacks), self.samples
+            if elapsed_time >= self.threshold:
+                self.report(turn, elapsed_time, stacks, samples)
+
+    def sample_loop(self, sampler_stopped: threading.Event):
+        """
+        Снятие стеков отслеживаемых потоков
+        :param sampler_stopped: событие остановки этого потока
+        """
+        while not sampler_stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                # остановленный поток не должен добавлять стеки в выборку следующей фразы
+                if sampler_stopped.is_set():
+                    break
+                for thread_id in self.watched_threads:
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self.stacks[self.collapse_stack(frame)] += 1
+                self.samples += 1
+
+    @staticmethod
+    def collapse_stack(frame):
+        """
+        Свёртка стека в строку "функция (файл:строка);..." от внешнего вызова к внутреннему
+        """
+        stack = []
+        while frame is not None:
+            stack.append("{} ({}:{})".format(frame.f_code.co_name, os.path.basename(frame.f_code.co_filename),
+                                             frame.f_lineno))
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def report(self, turn: str, elapsed_time: float, stacks: list, samples: int):
+        """
+        Вывод и сохранение отчёта о медленной фразе
+        """
+        with self.lock:
+            self.slow_turns += 1
+        print(colored("Slow turn ({:.2f} s): {}".format(elapsed_time, turn), "yellow"))
+        for stack, hits in stacks:
+            # в лог выводятся только самые внутренние вызовы, полный стек - в файле
+            print(colored("  {:>5.1f}% ...;{}".format(100 * hits / max(1, samples), ";".join(stack.split(";")[-3:])),
+                          "yellow"))
+
+        try:
+            os.makedirs(os.path.dirname(self.report_file) or ".", exist_ok=True)
+            with open(self.report_file, "a", encoding="UTF-8") as file:
+                file.write(json.dumps({"time": time.time(), "turn": turn, "elapsed_time": elapsed_time,
+                                       "samples": samples, "stacks": [{"stack": stack, "hits": hits}
+                                                                      for stack, hits in stacks]},
+                                      ensure_ascii=False) + "\n")
+        except OSError:
+            traceback.print_exc()
+
+
+# задержки этапов и профилировщик медленных фраз (порог задаётся аргументом --profile-slow-turns)
+stage_metrics = StageMetrics()
+turn_profiler = SlowTurnProfiler()
+
+
+class AudioBuffer:
+    """
+    Записанное с микрофона аудио в памяти: сырые PCM-кадры и их параметры (без промежуточного wav-файла)
+    """
+
+    def __init__(self, frames, sample_rate: int, sample_width: int, channels: int = 1, source=None):
+        self.frames = memoryview(frames)
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self.source = source  # исходный объект speech_recognition.AudioData (если буфер создан из него)
+        self.offline_result = None  # (фраза, уверенность), если аудио уже распознано Vosk во время записи
+
+    @classmethod
+    def from_audio_data(cls, audio):
+        """
+        Создание буфера из результата recognizer.listen без копирования кадров
+        :param audio: объект speech_recognition.AudioData
+        :return: буфер с аудио
+        """
+        return cls(audio.frame_data, audio.sample_rate, audio.sample_width, source=audio)
+
+    def to_audio_data(self):
+        """
+        Получение объекта speech_recognition.AudioData для online-распознавания
+        :return: исходный объект AudioData или новый объект поверх тех же кадров
+        """
+        if self.source is None:
+            self.source = speech_recognition.AudioData(self.to_bytes(), self.sample_rate, self.sample_width)
+        return self.source
+
+    def to_bytes(self):
+        """
+        Получение кадров в виде bytes (без копирования, если буфер покрывает весь исходный объект)
+        :return: сырые PCM-кадры
+        """
+        if isinstance(self.frames.obj, bytes) and self.frames.nbytes == len(self.frames.obj):
+            return self.frames.obj
+        return self.frames.tobytes()
+
+    def get_duration(self):
+        """
+        Получение длительности записи в секундах
+        """
+        return self.frames.nbytes / (self.sample_rate * self.sample_width * self.channels)
+
+    def write_wav(self, file_name: str):
+        """
+        Сохранение записи в wav-файл (для отладки)
+        :param file_name: путь к файлу
+        """
+        with wave.open(file_name, "wb") as wave_audio_file:
+            wave_audio_file.setnchannels(self.channels)
+            wave_audio_file.setsampwidth(self.sample_width)
+            wave_audio_file.setframerate(self.sample_rate)
+            wave_audio_file.writeframes(self.frames)
+
+
+class VoskModelRegistry:
+    """
+    Реестр оффлайн-моделей Vosk: модель каждого языка загружается один раз и остаётся в памяти,
+    а распознаватели переиспользуются (отдельный пул для каждой частоты дискретизации)
+    """
+
+    def __init__(self, models_directory: str = "models"):
+        self.models_directory = models_directory
+        self.models = {}  # язык -> загруженная модель
+        self.recognizers = {}  # (язык, частота дискретизации) -> список свободных распознавателей
+        self.load_times = {}  # язык -> время загрузки модели в секундах
+        self.active_language = ""
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.loading = {}  # язык -> событие окончания загрузки (чтобы не грузить одну модель дважды)
+
+    def get_model_path(self, language: str):
+        """
+        Получение пути к каталогу модели на нужном языке
+        :param language: код языка модели
+        :return: путь к каталогу модели
+        """
+        return os.path.join(self.models_directory, "vosk-model-small-" + language + "-0.4")
+
+    def has_model(self, language: str):
+        """
+        Проверка наличия модели на нужном языке в каталоге приложения
+        :param language: код языка модели
+        """
+        return os.path.exists(self.get_model_path(language))
+
+    def is_loaded(self, language: str):
+        """
+        Проверка, загружена ли уже модель на нужном языке (без ожидания фоновой загрузки)
+        :param language: код языка модели
+        """
+        with self.lock:
+            return language in self.models
+
+    def get_model(self, language: str):
+        """
+        Получение модели из памяти (с загрузкой с диска только при первом обращении)
+        :param language: код языка модели
+        :return: загруженная модель Vosk
+        """
+        with self.lock:
+            if language in self.models:
+                self.hits += 1
+                return self.models[language]
+
+            # если модель уже грузится в другом потоке, то дожидаемся окончания загрузки
+            loaded_event = self.loading.get(language)
+            owner = loaded_event is None
+            if owner:
+                self.misses += 1
+                loaded_event = self.loading[language] = threading.Event()
+
+        if not owner:
+            loaded_event.wait()
+            with self.lock:
+                if language in self.models:
+                    self.hits += 1
+                    return self.models[language]
+            return self.get_model(language)
+
+        try:
+            start_time = time.perf_counter()
+            model = vosk.Model(self.get_model_path(language))
+            with self.lock:
+                self.models[language] = model
+                self.load_times[language] = time.perf_counter() - start_time
+            return model
+        finally:
+            with self.lock:
+                del self.loading[language]
+            loaded_event.set()
+
+    def preload(self, language: str):
+        """
+        Фоновая загрузка модели, чтобы первое оффлайн-распознавание не ждало чтения модели с диска
+        :param language: код языка модели
+        """
+        if not self.has_model(language):
+            return
+
+        def load():
+            try:
+                self.get_model(language)
+            except:
+                traceback.print_exc()
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def acquire_recognizer(self, language: str, sample_rate: int):
+        """
+        Получение свободного распознавателя из пула (или создание нового, если свободных нет)
+        :param language: код языка модели
+        :param sample_rate: частота дискретизации аудио
+        :return: распознаватель Kaldi
+        """
+        with self.lock:
+            pool = self.recognizers.get((language, sample_rate))
+            if pool:
+                self.hits += 1
+                return pool.pop()
+
+        offline_recognizer = vosk.KaldiRecognizer(self.get_model(language), sample_rate)
+        offline_recognizer.SetWords(True)  # уверенность распознавания каждого слова (для выбора результата)
+        return offline_recognizer
+
+    def release_recognizer(self, language: str, sample_rate: int, offline_recognizer):
+        """
+        Возвращение распознавателя в пул со сбросом его состояния
+        :param language: код языка модели
+        :param sample_rate: частота дискретизации аудио
+        :param offline_recognizer: распознаватель, полученный через acquire_recognizer
+        """
+        offline_recognizer.Reset()
+        with self.lock:
+            # в пул не возвращаются только распознаватели выгруженных моделей (switch_language с unload_previous);
+            # распознаватели других загруженных языков остаются в пуле - ими пользуются сессии сервера
+            if language in self.models:
+                self.recognizers.setdefault((language, sample_rate), []).append(offline_recognizer)
+
+    def switch_language(self, language: str, unload_previous: bool = False):
+        """
+        Переключение активного языка: сброс пулов распознавателей остальных языков и фоновая загрузка новой модели
+        :param language: код нового языка
+        :param unload_previous: выгрузить ли из памяти модели остальных языков
+        """
+        with self.lock:
+            self.active_language = language
+            for key in [key for key in self.recognizers if key[0] != language]:
+                del self.recognizers[key]
+            if unload_previous:
+                for other_language in [other for other in self.models if other != language]:
+                    del self.models[other_language]
+
+        if language not in self.models:
+            self.preload(language)
+
+    def get_stats(self):
+        """
+        Получение статистики работы реестра
+        :return: словарь с временем загрузки моделей и счётчиками попаданий/промахов
+        """
+        with self.lock:
+            return {
+                "active_language": self.active_language,
+                "loaded_languages": list(self.models),
+                "load_times": dict(self.load_times),
+                "hits": self.hits,
+                "misses": self.misses,
+                "pooled_recognizers": {"{}@{}".format(*key): len(pool) for key, pool in self.recognizers.items()},
+            }
+
+
+@functools.lru_cache(maxsize=None)
+def numpy_available():
+    """
+    Проверка наличия NumPy (проверяется один раз, сам модуль импортируется при первом расчёте)
+    """
+    return numpy.is_module_available()
+
+
+def get_frame_energies(frames, sample_width: int, frame_size: int):
+    """
+    Расчёт энергии (RMS) сигнала для каждого кадра аудио
+    :param frames: сырые PCM-кадры
+    :param sample_width: размер одного отсчёта в байтах
+    :param frame_size: количество отсчётов в одном кадре
+    :return: список энергий кадров (неполный последний кадр отбрасывается)
+    """
+    frames = memoryview(frames).cast("B")
+    frames_count = len(frames) // (sample_width * frame_size)
+    if frames_count == 0:
+        return []
+
+    # векторизованный расчёт для 16-битного звука (стандартный формат speech_recognition.Microphone)
+    if sample_width == 2 and numpy_available():
+        samples = numpy.frombuffer(frames, dtype=numpy.int16, count=frames_count * frame_size)
+        samples = samples.reshape(frames_count, frame_size).astype(numpy.float64)
+        return numpy.sqrt(numpy.mean(samples * samples, axis=1)).tolist()
+
+    frame_bytes = sample_width * frame_size
+    return [audioop.rms(frames[index * frame_bytes:(index + 1) * frame_bytes], sample_width)
+            for index in range(frames_count)]
+
+
+def get_frame_zero_crossing_rates(frames, sample_width: int, frame_size: int):
+    """
+    Расчёт частоты пересечения нуля (доли отсчётов, на которых меняется знак сигнала) для каждого кадра аудио
+    :param frames: сырые PCM-кадры
+    :param sample_width: размер одного отсчёта в байтах
+    :param frame_size: количество отсчётов в одном кадре
+    :return: список частот пересечения нуля (неполный последний кадр отбрасывается)
+    """
+    frames = memoryview(frames).cast("B")
+    frames_count = len(frames) // (sample_width * frame_size)
+    if frames_count == 0:
+        return []
+
+    if sample_width == 2 and numpy_available():
+        samples = numpy.frombuffer(frames, dtype=numpy.int16, count=frames_count * frame_size)
+        signs = numpy.signbit(samples.reshape(frames_count, frame_size))
+        return (numpy.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_size).tolist()
+
+    frame_bytes = sample_width * frame_size
+    return [audioop.cross(frames[index * frame_bytes:(index + 1) * frame_bytes], sample_width) / frame_size
+            for index in range(frames_count)]
+
+
+class VoiceActivityDetector:
+    """
+    Проверка наличия речи в записи перед распознаванием: тишина и шум не отправляются в Google и Vosk,
+    а тишина в начале и в конце фразы обрезается (по энергии и частоте пересечения нуля каждого кадра)
+    """
+
+    def __init__(self, speech_recognizer, frame_duration: float = 0.03, min_speech_duration: float = 0.2,
+                 padding: float = 0.25, max_zero_crossing_rate: float = 0.25, loud_ratio: float = 3.0):
+        self.recognizer = speech_recognizer
+        self.frame_duration = frame_duration  # длительность кадра в секундах
+        self.min_speech_duration = min_speech_duration  # фраза с меньшим количеством речи считается шумом
+        self.padding = padding  # сколько секунд тишины оставлять вокруг речи
+        self.max_zero_crossing_rate = max_zero_crossing_rate  # выше - шипение и шум, а не голос
+        self.loud_ratio = loud_ratio  # во сколько раз громче порога должен быть кадр, чтобы не проверять его шумность
+        self.checked = 0
+        self.skipped_recognitions = 0  # сколько фраз без речи не отправлено на распознавание
+        self.bytes_saved = 0  # сколько байт аудио не отправлено на распознавание
+        self.lock = threading.Lock()
+
+    def is_speech(self, energy: float, zero_crossing_rate: float):
+        """
+        Проверка, содержит ли кадр речь
+        """
+        threshold = self.recognizer.energy_threshold
+        return energy > threshold and (zero_crossing_rate < self.max_zero_crossing_rate
+                                       or energy > threshold * self.loud_ratio)
+
+    def trim(self, audio_buffer: AudioBuffer):
+        """
+        Обрезка тишины в начале и в конце записи
+        :param audio_buffer: записанное с микрофона аудио
+        :return: буфер только с речью (и небольшими паузами вокруг неё) или None, если речи в записи нет
+        """
+        sample_width = audio_buffer.sample_width * audio_buffer.channels
+        frame_size = max(1, int(audio_buffer.sample_rate * self.frame_duration))
+        energies = get_frame_energies(audio_buffer.frames, sample_width, frame_size)
+        zero_crossing_rates = get_frame_zero_crossing_rates(audio_buffer.frames, sample_width, frame_size)
+        speech_frames = [index for index, (energy, zero_crossing_rate) in enumerate(zip(energies, zero_crossing_rates))
+                         if self.is_speech(energy, zero_crossing_rate)]
+
+        with self.lock:
+            self.checked += 1
+            if len(speech_frames) * self.frame_duration < self.min_speech_duration:
+                self.skipped_recognitions += 1
+                self.bytes_saved += audio_buffer.frames.nbytes
+                return None
+
+            padding_frames = int(self.padding / self.frame_duration)
+            frame_bytes = frame_size * sample_width
+            start = max(0, speech_frames[0] - padding_frames) * frame_bytes
+            end = min(len(energies), speech_frames[-1] + 1 + padding_frames) * frame_bytes
+            if speech_frames[-1] + 1 + padding_frames >= len(energies):
+                end = audio_buffer.frames.nbytes  # неполный последний кадр не отбрасывается
+            self.bytes_saved += audio_buffer.frames.nbytes - (end - start)
+
+        if start == 0 and end == audio_buffer.frames.nbytes:
+            return audio_buffer
+
+        trimmed_buffer = AudioBuffer(audio_buffer.frames.cast("B")[start:end], audio_buffer.sample_rate,
+                                     audio_buffer.sample_width, audio_buffer.channels)
+        trimmed_buffer.offline_result = audio_buffer.offline_result
+        return trimmed_buffer
+
+    def get_stats(self):
+        with self.lock:
+            return {"checked": self.checked, "skipped_recognitions": self.skipped_recognitions,
+                    "bytes_saved": self.bytes_saved}
+
+
+class NoiseEstimator:
+    """
+    Непрерывная оценка уровня шумов окружения по паузам до и после фраз
+    (вместо калибровки перед каждой записью)
+    """
+
+    def __init__(self, speech_recognizer, frame_duration: float = 0.05, damping: float = 0.15):
+        self.recognizer = speech_recognizer
+        self.frame_duration = frame_duration  # длительность кадра для расчёта энергии в секундах
+        self.damping = damping  # доля старого порога, остающаяся после 1 секунды наблюдения шумов
+        self.noise_energy = 0.0
+        self.calibrations = 0  # количество полноценных калибровок по микрофону
+        self.recalibrations = 0  # количество обновлений порога по паузам между фразами
+        self.lock = threading.Lock()
+
+    def calibrate(self, source, duration: float = 0.5):
+        """
+        Короткая первичная калибровка по микрофону (выполняется один раз при запуске)
+        :param source: открытый микрофон
+        :param duration: длительность калибровки в секундах
+        """
+        with self.lock:
+            self.recognizer.adjust_for_ambient_noise(source, duration=duration)
+            self.noise_energy = self.recognizer.energy_threshold / self.recognizer.dynamic_energy_ratio
+            self.calibrations += 1
+
+    def is_calibrated(self):
+        return self.calibrations > 0
+
+    def update(self, audio_buffer: AudioBuffer):
+        """
+        Обновление порога энергии по паузам в начале и в конце записанной фразы
+        (speech_recognition оставляет в записи non_speaking_duration секунд тишины с обеих сторон)
+        :param audio_buffer: записанное с микрофона аудио
+        """
+        frame_size = max(1, int(audio_buffer.sample_rate * self.frame_duration))
+        energies = get_frame_energies(audio_buffer.frames, audio_buffer.sample_width * audio_buffer.channels,
+                                      frame_size)
+        pause_frames = int(self.recognizer.non_speaking_duration / self.frame_duration)
+        if pause_frames == 0 or len(energies) < 2 * pause_frames:
+            return
+
+        # медиана устойчива к началу и концу речи, попавшим в паузы
+        pauses = energies[:pause_frames] + energies[-pause_frames:]
+        observed_energy = statistics.median(pauses)
+
+        with self.lock:
+            # экспоненциальное сглаживание с учётом длительности наблюдения (как в adjust_for_ambient_noise)
+            damping = self.damping ** (len(pauses) * self.frame_duration)
+            self.noise_energy = self.noise_energy * damping + observed_energy * (1 - damping)
+            self.recognizer.energy_threshold = self.noise_energy * self.recognizer.dynamic_energy_ratio
+            self.recalibrations += 1
+
+    def get_stats(self):
+        """
+        Получение текущего порога энергии и счётчиков калибровок
+        """
+        with self.lock:
+            return {
+                "energy_threshold": self.recognizer.energy_threshold,
+                "noise_energy": self.noise_energy,
+                "calibrations": self.calibrations,
+                "recalibrations": self.recalibrations,
+            }
+
+
+@functools.lru_cache(maxsize=None)
+def get_voice_id(language: str, sex: str):
+    """
+    Получение идентификатора голоса (индекс может меняться в зависимости от настроек операционной системы).
+    Список голосов запрашивается у движка один раз, найденные голоса запоминаются
+    :param language: код языка
+    :param sex: пол голоса
+    :return: идентификатор голоса для движка синтеза речи
+    """
+    voices = get_available_voices()
+
+    if language == "en":
+        if sex == "female":
             # Microsoft Zira Desktop - English (United States)
-            ttsEngine.setProperty("voice", voices[1].id)
-        else:
-            # Microsoft David Desktop - English (United States)
-            ttsEngine.setProperty("voice", voices[2].id)
-    else:
-        assistant.recognition_language = "ru-RU"
-        # Microsoft Irina Desktop - Russian
-        ttsEngine.setProperty("voice", voices[0].id)
+            return voices[1].id
+        # Microsoft David Desktop - English (United States)
+        return voices[2].id
 
+    # Microsoft Irina Desktop - Russian
+    return voices[0].id
 
-def record_and_recognize_audio(*args: tuple):
+
+@functools.lru_cache(maxsize=None)
+def get_available_voices():
     """
-    Запись и распознавание аудио
+    Получение списка установленных в системе голосов (запрашивается у движка один раз)
     """
-    with microphone:
-        recognized_data = ""
+    return ttsEngine.getProperty("voices")
+
+
+def set_voice(language: str):
+    """
+    Смена голоса ассистента на голос нужного языка (без лишних обращений к движку, если голос уже выбран)
+    :param language: код языка
+    """
+    session = get_session()
+    session.voice_language = language
+    if not session.speak_locally:
+        return
+
+    voice_id = get_voice_id(language, assistant.sex)
+    with speech_lock:
+        if ttsEngine.getProperty("voice") != voice_id:
+            ttsEngine.setProperty("voice", voice_id)
+
+
+def setup_assistant_voice():
+    """
+    Установка голоса по умолчанию
+    """
+    assistant.recognition_language = "en-US" if assistant.speech_language == "en" else "ru-RU"
+    set_voice(assistant.speech_language)
 
-        # запоминание шумов окружения для последующей очистки звука от них
-        recognizer.adjust_for_ambient_noise(microphone, duration=2)
 
+def capture_audio(timeout=5, update_noise: bool = True):
+    """
+    Запись одной фразы с уже открытого микрофона
+    :param timeout: сколько секунд ждать начала фразы
+    :param update_noise: обновлять ли оценку шумов по паузам записи (конвейер делает это сам,
+    чтобы речь ассистента не попадала в оценку)
+    :return: буфер с записанным аудио или None, если фраза так и не началась
+    """
+    # короткое запоминание шумов окружения только при первой записи,
+    # дальше порог обновляется по паузам между фразами
+    if not noise_estimator.is_calibrated():
+        with stage_metrics.timed("noise_calibration"):
+            noise_estimator.calibrate(microphone)
+
+    capture_start = time.perf_counter()
+    # пока модель грузится в фоне (при запуске или после смены языка), фраза записывается обычным способом:
+    # ожидание загрузки во время потоковой записи привело бы к потере начала фразы
+    if assistant.streaming_recognition and vosk_models.is_loaded(assistant.speech_language):
+        print("Listening...")
+        audio_buffer = capture_audio_streaming(timeout, 5)
+        if audio_buffer is None:
+            return None
+    else:
         try:
             print("Listening...")
-            audio = recognizer.listen(microphone, 5, 5)
+            audio = recognizer.listen(microphone, timeout, 5)
+        except speech_recognition.WaitTimeoutError:
+            return None
+        audio_buffer = AudioBuffer.from_audio_data(audio)
 
-            with open("microphone-results.wav", "wb") as file:
-                file.write(audio.get_wav_data())
+    # учитываются только записанные фразы (ожидание начала фразы - не задержка ассистента)
+    stage_metrics.observe("capture", time.perf_counter() - capture_start)
+    if update_noise:
+        noise_estimator.update(audio_buffer)
 
-        except speech_recognition.WaitTimeoutError:
-            play_voice_assistant_speech(translator.get("Can you check if your microphone is on, please?"))
-            traceback.print_exc()
+    # сохранение записи на диск только в режиме отладки
+    if assistant.debug_audio_file:
+        audio_buffer.write_wav(assistant.debug_audio_file)
+
+    return audio_buffer
+
+
+def capture_audio_streaming(timeout, phrase_time_limit):
+    """
+    Запись одной фразы с одновременным распознаванием через Vosk: аудио передаётся распознавателю по мере записи,
+    а по промежуточным результатам заранее запускаются сетевые запросы навыков (границы фразы определяются
+    так же, как в recognizer.listen)
+    :param timeout: сколько секунд ждать начала фразы
+    :param phrase_time_limit: максимальная длительность фразы в секундах
+    :return: буфер с записанным аудио (с результатом Vosk в offline_result) или None, если фраза так и не началась
+    """
+    seconds_per_buffer = microphone.CHUNK / microphone.SAMPLE_RATE
+    pause_buffer_count = int(recognizer.pause_threshold / seconds_per_buffer + 0.999)
+    non_speaking_buffer_count = int(recognizer.non_speaking_duration / seconds_per_buffer + 0.999)
+
+    # ожидание начала фразы (с сохранением небольшого фрагмента тишины перед ней)
+    frames = collections.deque(maxlen=non_speaking_buffer_count)
+    elapsed_time = 0.0
+    while True:
+        buffer = microphone.stream.read(microphone.CHUNK)
+        elapsed_time += seconds_per_buffer
+        frames.append(buffer)
+        if audioop.rms(buffer, microphone.SAMPLE_WIDTH) > recognizer.energy_threshold:
+            break
+        if timeout and elapsed_time > timeout:
+            return None
+
+    language = assistant.speech_language
+    offline_recognizer = vosk_models.acquire_recognizer(language, microphone.SAMPLE_RATE)
+    speculative_prefetcher.reset()
+    segments, words = [], []
+    try:
+        frames = list(frames)
+        for buffer in frames:
+            if offline_recognizer.AcceptWaveform(buffer):
+                result = json.loads(offline_recognizer.Result())
+                segments.append(result["text"])
+                words.extend(result.get("result", []))
+
+        pause_count, phrase_time = 0, 0.0
+        while True:
+            buffer = microphone.stream.read(microphone.CHUNK)
+            phrase_time += seconds_per_buffer
+            frames.append(buffer)
+
+            # Vosk сам делит длинную фразу на части - законченные части накапливаются
+            segment_end = offline_recognizer.AcceptWaveform(buffer)
+            if segment_end:
+                result = json.loads(offline_recognizer.Result())
+                segments.append(result["text"])
+                words.extend(result.get("result", []))
+                partial_text = ""
+            else:
+                partial_text = json.loads(offline_recognizer.PartialResult())["partial"]
+
+            # по уже произнесённой части фразы заранее запускаются сетевые запросы навыка
+            speculative_prefetcher.observe(" ".join(segments + [partial_text]).strip(), segment_end)
+
+            if audioop.rms(buffer, microphone.SAMPLE_WIDTH) > recognizer.energy_threshold:
+                pause_count = 0
+            else:
+                pause_count += 1
+            if pause_count > pause_buffer_count or (phrase_time_limit and phrase_time > phrase_time_limit):
+                break
+
+        result = json.loads(offline_recognizer.FinalResult())
+        segments.append(result["text"])
+        words.extend(result.get("result", []))
+    finally:
+        vosk_models.release_recognizer(language, microphone.SAMPLE_RATE, offline_recognizer)
+
+    # удаление лишней тишины в конце фразы (как в recognizer.listen)
+    for _ in range(pause_count - non_speaking_buffer_count):
+        frames.pop()
+
+    audio_buffer = AudioBuffer(b"".join(frames), microphone.SAMPLE_RATE, microphone.SAMPLE_WIDTH)
+    confidence = sum(word["conf"] for word in words) / len(words) if words else 0.0
+    audio_buffer.offline_result = (" ".join(segment for segment in segments if segment), confidence)
+    return audio_buffer
+
+
+class SpeculativePrefetcher:
+    """
+    Заблаговременный запуск сетевых запросов навыка по промежуточным результатам распознавания:
+    пока пользователь договаривает фразу, данные для ответа уже загружаются в кэши навыков.
+    Запрос запускается только для устоявшихся аргументов (чтобы не загружать каждое недоговорённое слово)
+    """
+
+    def __init__(self, prefetchers: dict, max_in_flight: int = 2, stable_chunks: int = 8):
+        self.prefetchers = prefetchers  # обработчик команды -> функция предварительной загрузки данных
+        self.max_in_flight = max_in_flight  # сколько запросов может выполняться одновременно
+        self.stable_chunks = stable_chunks  # сколько фрагментов записи подряд аргументы не должны меняться
+        # отдельный пул, чтобы предварительные запросы не занимали потоки навыков
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_in_flight, thread_name_prefix="prefetch")
+        self.started_keys = set()  # запросы, уже запущенные для текущей фразы
+        self.last_key = None  # последний увиденный запрос и сколько фрагментов подряд он не менялся
+        self.stable_count = 0
+        self.in_flight = 0
+        self.started = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """
+        Начало новой фразы
+        """
+        with self.lock:
+            self.started_keys.clear()
+            self.last_key, self.stable_count = None, 0
+
+    def observe(self, partial_text: str, segment_end: bool = False):
+        """
+        Обработка промежуточного результата распознавания
+        :param partial_text: уже распознанная часть фразы
+        :param segment_end: Vosk закончил часть фразы (её слова больше не изменятся)
+        """
+        if not partial_text:
+            return
+        command_match = command_router.match(partial_text.split(" "))
+        if command_match is None or command_match.handler not in self.prefetchers:
             return
 
-        # использование online-распознавания через Google (высокое качество распознавания)
+        key = (command_match.handler, tuple(command_match.args))
+        with self.lock:
+            if key == self.last_key:
+                self.stable_count += 1
+            else:
+                self.last_key, self.stable_count = key, 1
+            # пока пользователь договаривает аргументы, они меняются с каждым фрагментом
+            if not segment_end and self.stable_count < self.stable_chunks:
+                return
+            if key in self.started_keys or self.in_flight >= self.max_in_flight:
+                return
+            self.started_keys.add(key)
+            self.in_flight += 1
+            self.started += 1
+
+        self.pool.submit(contextvars.copy_context().run, self.prefetch,
+                         self.prefetchers[command_match.handler], list(command_match.args))
+
+    def prefetch(self, prefetcher, args: list):
+        """
+        Выполнение предварительной загрузки (ошибки не мешают основному запросу навыка)
+        """
         try:
-            print("Started recognition...")
-            recognized_data = recognizer.recognize_google(audio, language=assistant.recognition_language).lower()
+            prefetcher(args)
+        except Exception:
+            with self.lock:
+                self.failed += 1
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def get_stats(self):
+        with self.lock:
+            return {"started": self.started, "failed": self.failed, "in_flight": self.in_flight}
+
+
+def recognize_audio(audio_buffer: AudioBuffer):
+    """
+    Распознавание записанной фразы
+    :param audio_buffer: записанное с микрофона аудио
+    :return: распознанная фраза (пустая строка, если ничего не удалось распознать)
+    """
+    # запись без речи не отправляется на распознавание, тишина вокруг речи обрезается
+    audio_buffer = voice_activity_detector.trim(audio_buffer)
+    if audio_buffer is None:
+        return ""
 
+    print("Started recognition...")
+    return recognition_strategy.recognize(audio_buffer)
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для online-распознавания: после нескольких неудач подряд запросы к Google
+    не выполняются в течение заданного времени (чтобы не ждать таймаута HTTP на каждой фразе)
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown  # сколько секунд запросы не выполняются после срабатывания
+        self.failures = 0  # количество неудач подряд
+        self.opened_at = None  # время срабатывания предохранителя
+        self.trips = 0  # сколько раз предохранитель срабатывал
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        Проверка, можно ли выполнить запрос (после перерыва пропускается пробный запрос)
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # пробный запрос: при новой неудаче предохранитель сразу срабатывает снова
+                self.opened_at = None
+                self.failures = self.failure_threshold - 1
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+    def get_state(self):
+        """
+        Получение состояния предохранителя ("closed" - запросы выполняются, "open" - нет)
+        """
+        with self.lock:
+            return "closed" if self.opened_at is None else "open"
+
+
+class RecognitionStrategy:
+    """
+    Выбор между online-распознаванием через Google и offline-распознаванием через Vosk:
+     * "fallback" - сначала Google, Vosk только при проблемах с доступом в Интернет;
+     * "race" - Google и Vosk запускаются одновременно, берётся первый уверенный результат;
+     * "prefer_online" - Google и Vosk запускаются одновременно, результат Google ждётся не дольше latency_budget
+    """
+
+    def __init__(self, mode: str = "prefer_online", latency_budget: float = 2.0, min_confidence: float = 0.7,
+                 circuit_breaker: CircuitBreaker = None):
+        self.mode = mode
+        self.latency_budget = latency_budget  # сколько секунд ждать Google в режиме prefer_online
+        self.min_confidence = min_confidence  # минимальная уверенность Vosk, чтобы не ждать Google в режиме race
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.pool = concurrent.futures.ThreadPoolExecutor(4, thread_name_prefix="recognition")
+        # Vosk выполняется в отдельном пуле (чтобы не ждать в очереди за зависшими запросами к Google)
+        self.offline_pool = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="offline_recognition")
+        self.wins = {"google": 0, "vosk": 0}  # какой способ распознавания дал итоговый результат
+        self.google_skipped = 0  # сколько раз Google не вызывался из-за сработавшего предохранителя
+        self.google_timeouts = 0  # сколько раз Google не ответил за latency_budget
+        self.fallbacks = 0
+        self.fallback_time = 0.0  # суммарное время ожидания Vosk после отказа от результата Google
+        self.lock = threading.Lock()
+
+    def recognize_online(self, audio_buffer: AudioBuffer, abandoned: threading.Event = None):
+        """
+        Online-распознавание через Google (высокое качество распознавания)
+        :param abandoned: устанавливается, если результат не дождались (неудача уже учтена предохранителем)
+        :return: распознанная фраза
+        :raises speech_recognition.RequestError: при проблемах с доступом в Интернет
+        """
+        try:
+            with stage_metrics.timed("recognition_google"):
+                recognized_data = recognizer.recognize_google(audio_buffer.to_audio_data(),
+                                                              language=assistant.recognition_language).lower()
         except speech_recognition.UnknownValueError:
-            pass  # play_voice_assistant_speech("What did you say again?")
+            recognized_data = ""  # play_voice_assistant_speech("What did you say again?")
+        except speech_recognition.RequestError:
+            if abandoned is None or not abandoned.is_set():
+                self.circuit_breaker.record_failure()
+            raise
+
+        if abandoned is None or not abandoned.is_set():
+            self.circuit_breaker.record_success()
+        return recognized_data
 
-        # в случае проблем с доступом в Интернет происходит попытка использовать offline-распознавание через Vosk
+    @staticmethod
+    def recognize_offline(audio_buffer: AudioBuffer):
+        """
+        Offline-распознавание через Vosk (если аудио уже распознано во время записи, берётся готовый результат)
+        :return: распознанная фраза и уверенность распознавания
+        """
+        if audio_buffer.offline_result is not None:
+            return audio_buffer.offline_result
+        return recognize_offline(audio_buffer)
+
+    @staticmethod
+    def has_offline_recognition(audio_buffer: AudioBuffer):
+        """
+        Проверка, может ли Vosk распознать фразу (аудио уже распознано во время записи или модель скачана)
+        """
+        return audio_buffer.offline_result is not None or vosk_models.has_model(assistant.speech_language)
+
+    def use_result(self, engine: str, recognized_data: str, fallback_start: float = None):
+        """
+        Учёт итогового результата в статистике
+        :param engine: способ распознавания, давший результат
+        :param recognized_data: распознанная фраза
+        :param fallback_start: момент отказа от результата Google (если пришлось ждать Vosk)
+        """
+        with self.lock:
+            self.wins[engine] += 1
+            if fallback_start is not None:
+                self.fallbacks += 1
+                self.fallback_time += time.perf_counter() - fallback_start
+        if fallback_start is not None:
+            stage_metrics.observe("recognition_vosk_fallback", time.perf_counter() - fallback_start)
+        return recognized_data
+
+    def use_offline_result(self, vosk_future: concurrent.futures.Future, fallback_start: float):
+        """
+        Получение результата Vosk после отказа от результата Google
+        """
+        if vosk_future is None:
+            return ""
+        print(colored("Trying to use offline recognition...", "cyan"))
+        return self.use_result("vosk", vosk_future.result()[0], fallback_start)
+
+    def recognize(self, audio_buffer: AudioBuffer):
+        """
+        Распознавание записанной фразы выбранным способом
+        :param audio_buffer: записанное с микрофона аудио
+        :return: распознанная фраза (пустая строка, если ничего не удалось распознать)
+        """
+        has_offline_recognition = self.has_offline_recognition(audio_buffer)
+
+        # при сработавшем предохранителе Google не вызывается вовсе (если без него есть чем распознать фразу)
+        if not self.circuit_breaker.allow_request() and has_offline_recognition:
+            with self.lock:
+                self.google_skipped += 1
+            return self.use_result("vosk", self.recognize_offline(audio_buffer)[0])
+
+        if self.mode == "fallback":
+            try:
+                return self.use_result("google", self.recognize_online(audio_buffer))
+            # в случае проблем с доступом в Интернет происходит попытка использовать offline-распознавание через Vosk
+            except speech_recognition.RequestError:
+                fallback_start = time.perf_counter()
+                print(colored("Trying to use offline recognition...", "cyan"))
+                return self.use_result("vosk", self.recognize_offline(audio_buffer)[0], fallback_start)
+
+        abandoned = threading.Event()
+        google_future = self.pool.submit(contextvars.copy_context().run, self.recognize_online, audio_buffer, abandoned)
+        vosk_future = None
+        if has_offline_recognition:
+            vosk_future = self.offline_pool.submit(contextvars.copy_context().run, self.recognize_offline, audio_buffer)
+
+        if self.mode == "race" and vosk_future is not None:
+            done, _ = concurrent.futures.wait((google_future, vosk_future),
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if vosk_future in done and not google_future.done():
+                recognized_data, confidence = vosk_future.result()
+                if recognized_data and confidence >= self.min_confidence:
+                    return self.use_result("vosk", recognized_data)
+
+        # результат Google ждётся не дольше отведённого времени, после этого используется результат Vosk
+        try:
+            timeout = self.latency_budget if self.mode == "prefer_online" and vosk_future is not None else None
+            return self.use_result("google", google_future.result(timeout=timeout))
         except speech_recognition.RequestError:
+            return self.use_offline_result(vosk_future, time.perf_counter())
+        except concurrent.futures.TimeoutError:
+            # не ответивший вовремя Google считается неудачей (чтобы предохранитель срабатывал при зависшей сети)
+            abandoned.set()
+            self.circuit_breaker.record_failure()
+            with self.lock:
+                self.google_timeouts += 1
+
+        # пустой результат Vosk не заменяет результат Google: в этом случае Google дожидается до конца
+        fallback_start = time.perf_counter()
+        recognized_data = vosk_future.result()[0]
+        if recognized_data:
             print(colored("Trying to use offline recognition...", "cyan"))
-            recognized_data = use_offline_recognition()
+            return self.use_result("vosk", recognized_data, fallback_start)
+        try:
+            return self.use_result("google", google_future.result())
+        except speech_recognition.RequestError:
+            return ""
 
-        return recognized_data
+    def get_stats(self):
+        """
+        Получение счётчиков распознавания и состояния предохранителя
+        """
+        with self.lock:
+            return {
+                "mode": self.mode,
+                "wins": dict(self.wins),
+                "google_skipped": self.google_skipped,
+                "google_timeouts": self.google_timeouts,
+                "fallbacks": self.fallbacks,
+                "average_fallback_time": self.fallback_time / max(1, self.fallbacks),
+                "circuit_breaker": self.circuit_breaker.get_state(),
+                "circuit_breaker_trips": self.circuit_breaker.trips,
+            }
+
+
+def record_and_recognize_audio(*args: tuple):
+    """
+    Запись и распознавание аудио
+    """
+    with microphone:
+        audio_buffer = capture_audio()
 
+    if audio_buffer is None:
+        play_voice_assistant_speech(translator.get("Can you check if your microphone is on, please?"))
+        return ""
 
-def use_offline_recognition():
+    return recognize_audio(audio_buffer)
+
+
+# состояние навыка, выполняемого в текущем потоке пула (используется для отмены)
+skill_context = threading.local()
+
+# блокировка движка синтеза речи (говорить может и поток команд, и навыки из пула)
+speech_lock = threading.RLock()
+
+# признак прерывания текущего ответа ассистента
+speech_interrupted = threading.Event()
+
+# ассистент произносит ответ (микрофон в это время слышит его речь)
+speaking = threading.Event()
+
+
+def is_skill_cancelled():
+    """
+    Проверка, не отменён ли навык, выполняемый в текущем потоке (например, по истечении времени ожидания)
+    """
+    cancelled = getattr(skill_context, "cancelled", None)
+    return cancelled is not None and cancelled.is_set()
+
+
+class SkillExecutor:
+    """
+    Выполнение сетевых навыков в пуле потоков с ограничением времени ответа:
+    если навык отвечает долго, ассистент предупреждает об этом, а по истечении времени отменяет его ответ
+    """
+
+    def __init__(self, deadlines: dict, max_workers: int = 4, still_working_ratio: float = 0.5):
+        self.deadlines = deadlines  # обработчик -> допустимое время выполнения в секундах
+        self.still_working_ratio = still_working_ratio  # доля времени, после которой звучит "ещё ищу"
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix="skill")
+        self.stats = {}  # название навыка -> счётчики вызовов, таймаутов и времени выполнения
+        self.lock = threading.Lock()
+
+    def run_skill(self, handler, args: tuple, cancelled: threading.Event, responded: threading.Event):
+        """
+        Выполнение навыка в потоке пула с замером времени
+        """
+        skill_context.cancelled, skill_context.responded = cancelled, responded
+        start_time = time.perf_counter()
+        try:
+            with turn_profiler.watch():
+                return handler(*args)
+        finally:
+            skill_context.cancelled = skill_context.responded = None
+            self.record(handler.__name__, time.perf_counter() - start_time)
+
+    def record(self, skill_name: str, elapsed_time: float = 0.0, timed_out: bool = False):
+        """
+        Обновление статистики навыка
+        """
+        with self.lock:
+            skill_stats = self.stats.setdefault(skill_name, {"calls": 0, "timeouts": 0,
+                                                             "total_time": 0.0, "max_time": 0.0})
+            if timed_out:
+                skill_stats["timeouts"] += 1
+                return
+            skill_stats["calls"] += 1
+            skill_stats["total_time"] += elapsed_time
+            skill_stats["max_time"] = max(skill_stats["max_time"], elapsed_time)
+        stage_metrics.observe("skill:" + skill_name, elapsed_time)
+
+    def execute(self, handler, *args):
+        """
+        Выполнение навыка: сетевые навыки - в пуле с ограничением времени, остальные - сразу в текущем потоке
+        :param handler: обработчик команды
+        :param args: аргументы, которые будут переданы в обработчик
+        """
+        deadline = self.deadlines.get(handler)
+        if deadline is None:
+            with stage_metrics.timed("skill:" + handler.__name__):
+                return handler(*args)
+
+        cancelled, responded = threading.Event(), threading.Event()
+        # навык выполняется от имени той же сессии пользователя
+        future = self.pool.submit(contextvars.copy_context().run, self.run_skill, handler, args, cancelled, responded)
+        try:
+            return future.result(timeout=deadline * self.still_working_ratio)
+        except concurrent.futures.TimeoutError:
+            if not responded.is_set():
+                play_voice_assistant_speech(translator.get("One moment, I'm still working on it"))
+
+        try:
+            return future.result(timeout=deadline * (1 - self.still_working_ratio))
+        except concurrent.futures.TimeoutError:
+            # навык, который уже начал отвечать, не прерывается (он ждёт не сеть, а озвучивание)
+            if responded.is_set():
+                return future.result()
+
+            # поток нельзя прервать принудительно, поэтому ответ навыка просто перестаёт озвучиваться
+            cancelled.set()
+            future.cancel()
+            self.record(handler.__name__, timed_out=True)
+            print(colored("Skill {} timed out after {} seconds".format(handler.__name__, deadline), "red"))
+            play_voice_assistant_speech(translator.get("Sorry, it is taking too long. Try again later"))
+
+    def get_stats(self):
+        """
+        Получение статистики навыков (включая среднее время выполнения)
+        """
+        with self.lock:
+            return {skill_name: dict(skill_stats,
+                                     average_time=skill_stats["total_time"] / max(1, skill_stats["calls"]))
+                    for skill_name, skill_stats in self.stats.items()}
+
+
+class AssistantPipeline:
+    """
+    Конвейер голосового ассистента: запись, распознавание и выполнение команд идут в отдельных потоках,
+    связанных очередями ограниченного размера (микрофон слушает, пока выполняется предыдущая команда)
+    """
+
+    def __init__(self, queue_size: int = 2):
+        # при заполнении очереди предыдущий этап ждёт (чтобы не копить устаревшие команды)
+        self.audio_queue = queue.Queue(maxsize=queue_size)
+        self.command_queue = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.threads = []
+        self.captured = 0
+        self.recognized = 0
+        self.executed = 0
+        self.interruptions = 0
+        self.dropped = 0  # фразы, записанные во время озвучивания ответа (в основном речь самого ассистента)
+
+    def put(self, target_queue: queue.Queue, item):
+        """
+        Передача данных на следующий этап с ожиданием свободного места в очереди
+        :return: False, если конвейер остановили во время ожидания
+        """
+        while not self.stopped.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, source_queue: queue.Queue):
+        """
+        Получение данных с предыдущего этапа
+        :return: данные или None, если конвейер остановили во время ожидания
+        """
+        while not self.stopped.is_set():
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def capture_loop(self):
+        """
+        Этап записи: микрофон открыт всё время работы конвейера
+        """
+        with microphone:
+            while not self.stopped.is_set():
+                listen_start = time.perf_counter()
+                audio_buffer = capture_audio(timeout=1, update_noise=False)
+                if audio_buffer is None:
+                    continue
+                self.captured += 1
+
+                # фраза началась не раньше начала ожидания и не раньше, чем за её длительность до конца записи
+                phrase_start = max(listen_start, time.perf_counter() - audio_buffer.get_duration())
+
+                # запись пересекалась с озвучиванием ответа, то есть микрофон мог слышать речь ассистента
+                # (фразы, сказанные, пока команда ждёт ответа сетевого сервиса, ставятся в очередь как обычно)
+                overlapped = speaking.is_set() or SpeechQueue.speech_end_time > phrase_start
+                if not overlapped:
+                    noise_estimator.update(audio_buffer)
+                elif assistant.barge_in:
+                    # новая фраза пользователя прерывает озвучивание предыдущего ответа
+                    self.interruptions += 1
+                    interrupt_speech()
+                else:
+                    # без прерывания (и эхоподавления) такая фраза - скорее всего речь самого ассистента
+                    self.dropped += 1
+                    continue
+
+                self.put(self.audio_queue, audio_buffer)
+
+    def recognition_loop(self):
+        """
+        Этап распознавания речи
+        """
+        while not self.stopped.is_set():
+            audio_buffer = self.get(self.audio_queue)
+            if audio_buffer is None:
+                continue
+
+            try:
+                voice_input = recognize_audio(audio_buffer)
+            except:
+                traceback.print_exc()
+                continue
+
+            print(colored(voice_input, "blue"))
+            if voice_input:
+                self.recognized += 1
+                self.put(self.command_queue, voice_input)
+
+    def command_loop(self):
+        """
+        Этап выполнения команд и озвучивания ответов
+        """
+        while not self.stopped.is_set():
+            voice_input = self.get(self.command_queue)
+            if voice_input is None:
+                continue
+
+            try:
+                execute_command(voice_input)
+                self.executed += 1
+            except SystemExit:
+                # команда выхода останавливает весь конвейер
+                self.stopped.set()
+            except:
+                traceback.print_exc()
+
+    def start(self):
+        """
+        Запуск всех этапов конвейера
+        """
+        for target in (self.capture_loop, self.recognition_loop, self.command_loop):
+            thread = threading.Thread(target=target, name=target.__name__, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self):
+        """
+        Запуск конвейера и ожидание его остановки (командой выхода или Ctrl+C)
+        """
+        self.start()
+        try:
+            while not self.stopped.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            self.stopped.set()
+
+    def get_stats(self):
+        """
+        Получение счётчиков этапов конвейера
+        """
+        return {
+            "captured": self.captured,
+            "recognized": self.recognized,
+            "executed": self.executed,
+            "interruptions": self.interruptions,
+            "dropped": self.dropped,
+            "audio_queue_size": self.audio_queue.qsize(),
+            "command_queue_size": self.command_queue.qsize(),
+        }
+
+
+def use_offline_recognition(audio_buffer: AudioBuffer):
     """
     Переключение на оффлайн-распознавание речи
+    :param audio_buffer: записанное с микрофона аудио
     :return: распознанная фраза
     """
-    recognized_data = ""
+    return recognize_offline(audio_buffer)[0]
+
+
+def recognize_offline(audio_buffer: AudioBuffer, language: str = None):
+    """
+    Оффлайн-распознавание речи через Vosk
+    :param audio_buffer: записанное с микрофона аудио
+    :param language: язык модели (по умолчанию - язык, на котором говорит ассистент)
+    :return: распознанная фраза и средняя уверенность распознавания слов (от 0 до 1)
+    """
+    recognized_data, confidence = "", 0.0
     try:
+        language = language or assistant.speech_language
+
         # проверка наличия модели на нужном языке в каталоге приложения
-        if not os.path.exists("models/vosk-model-small-" + assistant.speech_language + "-0.4"):
+        if not vosk_models.has_model(language):
             print(colored("Please download the model from:\n"
                           "https://alphacephei.com/vosk/models и распакуйте как 'model' в нужной папке.",
                           "red"))
-            exit(1)
+            return recognized_data, confidence
+
+        recognized_data, confidence = run_offline_recognition(audio_buffer, language)
+    except:
+        traceback.print_exc()
+        print(colored("Sorry, speech service is unavailable. Try again later.", "red"))
+
+    return recognized_data, confidence
+
 
-        # анализ записанного в микрофон аудио (чтобы избежать повторов фразы)
-        wave_audio_file = wave.open("microphone-results.wav", "rb")
-        model = Model("models/vosk-model-small-" + assistant.speech_language + "-0.4")
-        offline_recognizer = KaldiRecognizer(model, wave_audio_file.getframerate())
+def run_offline_recognition(audio_buffer: AudioBuffer, language: str):
+    """
+    Распознавание аудио моделью Vosk без перехвата ошибок (для пакетного режима, где ошибка записывается в результат)
+    :param audio_buffer: аудио в формате модели
+    :param language: язык модели
+    :return: распознанная фраза и средняя уверенность распознавания слов (от 0 до 1)
+    """
+    recognized_data, confidence = "", 0.0
 
-        data = wave_audio_file.readframes(wave_audio_file.getnframes())
+    # анализ записанного в микрофон аудио прямо из памяти (чтобы избежать повторов фразы)
+    sample_rate = audio_buffer.sample_rate
+
+    # модель и распознаватель берутся из реестра (без повторной загрузки модели с диска)
+    offline_recognizer = vosk_models.acquire_recognizer(language, sample_rate)
+    recognition_start = time.perf_counter()
+    try:
+        data = audio_buffer.to_bytes()
         if len(data) > 0:
+            # если Vosk не нашёл конец фразы, то берётся окончательный результат по всему аудио
             if offline_recognizer.AcceptWaveform(data):
-                recognized_data = offline_recognizer.Result()
+                result = offline_recognizer.Result()
+            else:
+                result = offline_recognizer.FinalResult()
+
+            # получение данных распознанного текста из JSON-строки (чтобы можно было выдать по ней ответ)
+            result = json.loads(result)
+            recognized_data = result["text"]
+            words = result.get("result", [])
+            if words:
+                confidence = sum(word["conf"] for word in words) / len(words)
+    finally:
+        stage_metrics.observe("recognition_vosk", time.perf_counter() - recognition_start)
+        vosk_models.release_recognizer(language, sample_rate, offline_recognizer)
 
-                # получение данных распознанного текста из JSON-строки (чтобы можно было выдать по ней ответ)
-                recognized_data = json.loads(recognized_data)
-                recognized_data = recognized_data["text"]
-    except:
-        traceback.print_exc()
-        print(colored("Sorry, speech service is unavailable. Try again later.", "red"))
+    return recognized_data, confidence
+
+
+class SpeechCache:
+    """
+    Кэш заранее синтезированных частых фраз (неизменные фразы из translations.json, приветствия и прощания
+    с именем владельца, результаты подбрасывания монетки) для мгновенного воспроизведения.
+    Записи хранятся по ключу (текст, язык, голос) в памяти и на диске, размер кэша ограничен
+    """
+
+    def __init__(self, cache_directory: str = os.path.join("cache", "speech"),
+                 max_memory_bytes: int = 32 * 1024 * 1024, max_disk_bytes: int = 128 * 1024 * 1024):
+        self.cache_directory = cache_directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = collections.OrderedDict()  # ключ -> AudioBuffer (в порядке последнего использования)
+        self.memory_bytes = 0
+        self.enabled = True  # отключается, если движок синтеза сохраняет речь не в wav
+        self.hits = 0
+        self.misses = 0
+        self.rendered = 0
+        self.lock = threading.Lock()
+        self.player = None
+        os.makedirs(cache_directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(text: str):
+        """
+        Получение ключа записи для текущих языка и голоса ассистента
+        """
+        return text, assistant.speech_language, str(ttsEngine.getProperty("voice"))
+
+    def get_file_path(self, key: tuple):
+        """
+        Получение пути к файлу записи на диске
+        """
+        return os.path.join(self.cache_directory,
+                            hashlib.sha1(json.dumps(key).encode("UTF-8")).hexdigest() + ".wav")
+
+    def put(self, key: tuple, audio_buffer: AudioBuffer):
+        """
+        Добавление записи в память с вытеснением давно не использованных записей
+        """
+        with self.lock:
+            if key in self.entries:
+                self.memory_bytes -= self.entries.pop(key).frames.nbytes
+            self.entries[key] = audio_buffer
+            self.memory_bytes += audio_buffer.frames.nbytes
+            while self.memory_bytes > self.max_memory_bytes and len(self.entries) > 1:
+                self.memory_bytes -= self.entries.popitem(last=False)[1].frames.nbytes
+
+    def get(self, text: str):
+        """
+        Получение синтезированной фразы из памяти или с диска
+        :param text: текст фразы
+        :return: буфер с аудио или None, если фраза ещё не синтезирована
+        """
+        if not self.enabled or not text.strip():
+            return None
+
+        key = self.get_key(text)
+        with self.lock:
+            audio_buffer = self.entries.get(key)
+            if audio_buffer is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return audio_buffer
+
+        file_path = self.get_file_path(key)
+        if not os.path.exists(file_path):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        audio_buffer = self.load(file_path)
+        if audio_buffer is not None:
+            self.put(key, audio_buffer)
+            with self.lock:
+                self.hits += 1
+        return audio_buffer
+
+    def load(self, file_path: str):
+        """
+        Чтение синтезированной фразы из wav-файла
+        """
+        try:
+            with wave.open(file_path, "rb") as wave_audio_file:
+                return AudioBuffer(wave_audio_file.readframes(wave_audio_file.getnframes()),
+                                   wave_audio_file.getframerate(), wave_audio_file.getsampwidth(),
+                                   wave_audio_file.getnchannels())
+        except (wave.Error, EOFError):
+            # движок синтеза сохраняет речь в другом формате (например, aiff на macOS) - кэш не используется
+            self.enabled = False
+            print(colored("Speech cache is disabled: TTS engine does not produce wav files", "red"))
+            return None
+
+    def render(self, text: str):
+        """
+        Синтез фразы в файл текущим голосом ассистента
+        :param text: текст фразы
+        """
+        with speech_lock:
+            key = self.get_key(text)
+            file_path = self.get_file_path(key)
+            if os.path.exists(file_path):
+                return
+
+            temporary_file_path = file_path + ".tmp.wav"
+            ttsEngine.save_to_file(text, temporary_file_path)
+            ttsEngine.runAndWait()
+
+        if not os.path.exists(temporary_file_path):
+            return
+        os.replace(temporary_file_path, file_path)
+        audio_buffer = self.load(file_path)
+        if audio_buffer is not None:
+            self.put(key, audio_buffer)
+            self.rendered += 1
+
+    def prerender(self, phrases: list):
+        """
+        Синтез фраз, которых ещё нет в кэше
+        :param phrases: список фраз (шаблоны вида "Привет, {}!" пропускаются: фразы с подставляемыми значениями
+        синтезируются целиком уже после подстановки, а не склеиваются из кусков)
+        """
+        for phrase in phrases:
+            if not self.enabled:
+                return
+            has_fields = any(field_name is not None for _, field_name, _, _ in string.Formatter().parse(phrase))
+            if has_fields or not any(char.isalnum() for char in phrase):
+                continue
+            try:
+                self.render(phrase)
+            except:
+                traceback.print_exc()
+        self.prune_disk()
+
+    def prerender_async(self, phrases: list):
+        """
+        Фоновый синтез фраз (чтобы не задерживать запуск ассистента)
+        """
+        threading.Thread(target=self.prerender, args=(phrases,), daemon=True).start()
+
+    def prune_disk(self):
+        """
+        Удаление самых старых файлов кэша при превышении допустимого размера на диске
+        """
+        # файлы, которые сейчас синтезирует другой поток (*.tmp.wav), не трогаются,
+        # а файлы, удалённые или заменённые во время обхода, пропускаются
+        files = []
+        for file_name in os.listdir(self.cache_directory):
+            if file_name.endswith(".tmp.wav"):
+                continue
+            file_path = os.path.join(self.cache_directory, file_name)
+            try:
+                file_stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            files.append((file_stat.st_mtime, file_stat.st_size, file_path))
+
+        files.sort()
+        disk_bytes = sum(file_size for _, file_size, _ in files)
+        for _, file_size, file_path in files:
+            if disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            disk_bytes -= file_size
+
+    def play(self, audio_buffer: AudioBuffer):
+        """
+        Воспроизведение синтезированной фразы (с возможностью прерывания)
+        :param audio_buffer: буфер с аудио
+        """
+        pyaudio = speech_recognition.Microphone.get_pyaudio()
+        if self.player is None:
+            self.player = pyaudio.PyAudio()
+
+        stream = self.player.open(format=self.player.get_format_from_width(audio_buffer.sample_width),
+                                  channels=audio_buffer.channels, rate=audio_buffer.sample_rate, output=True)
+        try:
+            chunk_bytes = 1024 * audio_buffer.sample_width * audio_buffer.channels
+            frames = audio_buffer.frames.cast("B")
+            for offset in range(0, len(frames), chunk_bytes):
+                if speech_interrupted.is_set():
+                    break
+                stream.write(frames[offset:offset + chunk_bytes].tobytes())
+        finally:
+            stream.stop_stream()
+            stream.close()
+
+    def get_stats(self):
+        """
+        Получение статистики кэша
+        """
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self.entries),
+                "memory_bytes": self.memory_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rendered": self.rendered,
+            }
+
+
+class SpeechQueue:
+    """
+    Ответ ассистента из нескольких фраз: фразы собираются и озвучиваются за один проход движка синтеза речи
+    (передаются движку подряд и произносятся одним вызовом runAndWait, без пауз на запуск движка между ними)
+    или целиком из кэша, если все фразы ответа заранее синтезированы. Озвучивание можно прервать
+    """
+
+    speech_end_time = 0.0  # когда закончилось последнее озвучивание (для проверки пересечения с записью)
+
+    def __init__(self):
+        self.segments = []  # (текст или шаблон, значения для подстановки)
+
+    def add(self, text_to_speech, *format_args):
+        """
+        Добавление фразы в ответ
+        :param text_to_speech: текст фразы (или шаблон, если переданы format_args)
+        :param format_args: значения для подстановки в шаблон
+        :return: очередь (для цепочки вызовов)
+        """
+        self.segments.append((str(text_to_speech), format_args))
+        return self
+
+    def play(self):
+        """
+        Озвучивание всех собранных фраз (или их отправка клиенту, если сессия не озвучивается локально)
+        """
+        if not self.segments:
+            return
+
+        # ответ навыка, который не уложился в отведённое время, уже не озвучивается
+        if is_skill_cancelled():
+            return
+
+        responded = getattr(skill_context, "responded", None)
+        if responded is not None:
+            responded.set()
+
+        # ответы удалённых пользователей не озвучиваются, а отправляются клиенту
+        session = get_session()
+        if not session.speak_locally:
+            for text_to_speech, format_args in self.segments:
+                session.add_reply(text_to_speech.format(*format_args) if format_args else text_to_speech)
+            return
 
-    return recognized_data
+        texts = [text_to_speech.format(*format_args) if format_args else text_to_speech
+                 for text_to_speech, format_args in self.segments]
+
+        # из кэша воспроизводится только ответ, все фразы которого уже синтезированы целиком
+        # (в том числе заранее подготовленные фразы с подстановкой, например, приветствие с именем владельца),
+        # иначе весь ответ синтезируется одним проходом движка (без склейки кусков и лишних runAndWait)
+        audio_buffers = []
+        for text in texts:
+            audio_buffer = speech_cache.get(text)
+            if audio_buffer is None:
+                audio_buffers = []
+                break
+            audio_buffers.append(audio_buffer)
+
+        # движок синтеза речи не рассчитан на одновременные вызовы из нескольких потоков
+        with speech_lock:
+            # после прерывания пользователем команда больше ничего не произносит
+            # (признак сбрасывается в начале следующей команды, а не при каждом ответе)
+            if speech_interrupted.is_set():
+                return
+            speaking.set()
+            try:
+                if audio_buffers:
+                    for audio_buffer in audio_buffers:
+                        if speech_interrupted.is_set():
+                            return
+                        with stage_metrics.timed("speech_cached"):
+                            speech_cache.play(audio_buffer)
+                    return
+
+                for text in texts:
+                    ttsEngine.say(text)
+                self.run_engine()
+            finally:
+                SpeechQueue.speech_end_time = time.perf_counter()
+                speaking.clear()
+
+    @staticmethod
+    def run_engine():
+        """
+        Произнесение всех переданных движку фраз (interrupt_speech останавливает движок и очищает его очередь)
+        """
+        with stage_metrics.timed("tts"):
+            ttsEngine.runAndWait()
 
 
-def play_voice_assistant_speech(text_to_speech):
+def play_voice_assistant_speech(text_to_speech, *format_args):
     """
     Проигрывание речи ответов голосового ассистента (без сохранения аудио)
-    :param text_to_speech: текст, который нужно преобразовать в речь
+    :param text_to_speech: текст, который нужно преобразовать в речь (или шаблон, если переданы format_args)
+    :param format_args: значения для подстановки в шаблон
+    """
+    SpeechQueue().add(text_to_speech, *format_args).play()
+
+
+def interrupt_speech():
+    """
+    Прерывание текущего озвучивания ответа (например, когда пользователь начал новую фразу)
     """
-    ttsEngine.say(str(text_to_speech))
-    ttsEngine.runAndWait()
+    speech_interrupted.set()
+    ttsEngine.stop()
+
+
+# приветствия и прощания (с именем владельца, поэтому синтезируются заранее уже с подставленным именем)
+greeting_phrases = ["Hello, {}! How can I help you?", "Good day to you {}! How can I help you?"]
+farewell_phrases = ["Goodbye, {}! Have a nice day!", "See you soon, {}!"]
 
 
 def play_greetings(*args: tuple):
     """
     Проигрывание случайной приветственной речи
     """
-    greetings = [
-        translator.get("Hello, {}! How can I help you?").format(person.name),
-        translator.get("Good day to you {}! How can I help you?").format(person.name)
-    ]
-    play_voice_assistant_speech(greetings[random.randint(0, len(greetings) - 1)])
+    greetings = [translator.get(greeting) for greeting in greeting_phrases]
+    play_voice_assistant_speech(greetings[random.randint(0, len(greetings) - 1)], person.name)
 
 
 def play_farewell_and_quit(*args: tuple):
     """
      Проигрывание прощальной речи и выход
     """
-    farewells = [
-        translator.get("Goodbye, {}! Have a nice day!").format(person.name),
-        translator.get("See you soon, {}!").format(person.name)
-    ]
-    play_voice_assistant_speech(farewells[random.randint(0, len(farewells) - 1)])
+    farewells = [translator.get(farewell) for farewell in farewell_phrases]
+    play_voice_assistant_speech(farewells[random.randint(0, len(farewells) - 1)], person.name)
+
+    # удалённый пользователь завершает только свою сессию
+    if not get_session().speak_locally:
+        get_session().close()
+        return
+
     ttsEngine.stop()
     quit()
 
@@ -196,14 +2191,14 @@ def search_for_term_on_google(*args: tuple):
     # альтернативный поиск с автоматическим открытием ссылок на результаты (в некоторых случаях может быть небезопасно)
     search_results = []
     try:
-        for _ in search(search_term,  # что искать
-                        tld="com",  # верхнеуровневый домен
-                        lang=assistant.speech_language,  # используется язык, на котором говорит ассистент
-                        num=1,  # количество результатов на странице
-                        start=0,  # индекс первого извлекаемого результата
-                        stop=1,  # индекс последнего извлекаемого результата (я хочу, чтобы открывался первый результат)
-                        pause=1.0,  # задержка между HTTP-запросами
-                        ):
+        for _ in googlesearch.search(search_term,  # что искать
+                                     tld="com",  # верхнеуровневый домен
+                                     lang=assistant.speech_language,  # используется язык, на котором говорит ассистент
+                                     num=1,  # количество результатов на странице
+                                     start=0,  # индекс первого извлекаемого результата
+                                     stop=1,  # индекс последнего извлекаемого результата (я хочу, чтобы открывался первый результат)
+                                     pause=1.0,  # задержка между HTTP-запросами
+                                     ):
             search_results.append(_)
             webbrowser.get().open(_)
 
@@ -214,7 +2209,7 @@ def search_for_term_on_google(*args: tuple):
         return
 
     print(search_results)
-    play_voice_assistant_speech(translator.get("Here is what I found for you on google").format(search_term))
+    play_voice_assistant_speech(translator.get("Here is what I found for you on google"), search_term)
     
     
 def search_for_video_on_youtube(*args: tuple):
@@ -226,7 +2221,199 @@ def search_for_video_on_youtube(*args: tuple):
     search_term = " ".join(args[0])
     url = "https://www.youtube.com/results?search_query=" + search_term
     webbrowser.get().open(url)
-    play_voice_assistant_speech(translator.get("Here is what I found for {} on youtube").format(search_term))
+    play_voice_assistant_speech(translator.get("Here is what I found for {} on youtube"), search_term)
+
+
+class PersistentCache:
+    """
+    Кэш на диске (SQLite) с ограничением размера: при переполнении удаляются давно не использованные записи
+    """
+
+    def __init__(self, file_path: str, max_bytes: int = 16 * 1024 * 1024, flush_every: int = 64,
+                 flush_interval: float = 30):
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every  # для скольких записей копятся времена обращения перед записью на диск
+        self.flush_interval = flush_interval  # не дольше скольких секунд копятся обращения к записям
+        self.pending_accesses = {}  # ключ -> время последнего обращения (ещё не записанное на диск)
+        self.last_flush_time = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(file_path, check_same_thread=False)
+        # журнал WAL без синхронизации на каждой транзакции: потеря последних записей кэша при сбое не страшна
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries "
+                                "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self.connection.commit()
+
+        # накопленные времена обращения записываются при выходе из программы
+        atexit.register(self.flush)
+
+    @staticmethod
+    def get_key(*parts):
+        """
+        Получение ключа записи из нескольких частей (например, языка и поискового запроса)
+        """
+        return json.dumps(parts, ensure_ascii=False)
+
+    def get(self, key: str):
+        """
+        Получение записи с обновлением времени последнего использования
+        (время обращения записывается на диск не сразу, а вместе с другими обращениями)
+        :param key: ключ записи
+        :return: сохранённое значение или None
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.pending_accesses[key] = time.time()
+            if (len(self.pending_accesses) >= self.flush_every
+                    or time.time() - self.last_flush_time >= self.flush_interval):
+                self.flush_accesses()
+                self.connection.commit()
+        return json.loads(row[0])
+
+    def flush_accesses(self):
+        """
+        Запись накопленных времён обращения к записям одним запросом (вызывается под блокировкой, без commit)
+        """
+        if self.pending_accesses:
+            self.connection.executemany("UPDATE entries SET accessed = ? WHERE key = ?",
+                                        [(accessed, key) for key, accessed in self.pending_accesses.items()])
+            self.pending_accesses.clear()
+            self.flushes += 1
+        self.last_flush_time = time.time()
+
+    def flush(self):
+        """
+        Запись накопленных времён обращения к записям на диск (например, перед завершением программы)
+        """
+        with self.lock:
+            self.flush_accesses()
+            self.connection.commit()
+
+    def put(self, key: str, value):
+        """
+        Сохранение записи с вытеснением давно не использованных записей при превышении размера
+        :param key: ключ записи
+        :param value: значение (должно сериализоваться в JSON)
+        """
+        data = json.dumps(value, ensure_ascii=False)
+        with self.lock:
+            # перед вытеснением времена обращения должны быть актуальными
+            self.flush_accesses()
+            self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                                    (key, data, len(data.encode("UTF-8")), time.time()))
+
+            total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total_size > self.max_bytes:
+                evicted_keys = []
+                for evicted_key, size in self.connection.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                    if total_size <= self.max_bytes:
+                        break
+                    evicted_keys.append((evicted_key,))
+                    total_size -= size
+                self.connection.executemany("DELETE FROM entries WHERE key = ?", evicted_keys)
+                self.evictions += len(evicted_keys)
+
+            self.connection.commit()
+
+    def get_stats(self):
+        """
+        Получение статистики кэша
+        """
+        with self.lock:
+            entries_count, total_size = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            return {"entries": entries_count, "bytes": total_size, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "flushes": self.flushes,
+                    "pending_accesses": len(self.pending_accesses)}
+
+
+class WikipediaSummaries:
+    """
+    Получение кратких описаний страниц Wikipedia: одно HTTP-соединение на язык,
+    существование страницы, ссылка и описание запрашиваются одним запросом и сохраняются в кэш на диске
+    """
+
+    def __init__(self, cache: PersistentCache, timeout: float = 5, missing_ttl: float = 24 * 3600):
+        self.cache = cache
+        self.timeout = timeout
+        self.missing_ttl = missing_ttl  # через сколько секунд повторно проверяется отсутствующая страница
+        self.sessions = {}  # язык -> HTTP-сессия с открытым соединением к нужному разделу Wikipedia
+        self.lock = threading.Lock()
+
+    def get_session(self, language: str):
+        """
+        Получение HTTP-сессии для раздела Wikipedia на нужном языке
+        """
+        with self.lock:
+            if language not in self.sessions:
+                session = requests.Session()
+                session.headers["User-Agent"] = "VoiceAssistant/1.0 (https://github.com/ponpompon/aasdpoaspdaso)"
+                self.sessions[language] = session
+            return self.sessions[language]
+
+    def fetch(self, language: str, search_term: str):
+        """
+        Запрос страницы одним обращением к API Wikipedia
+        :param language: язык раздела Wikipedia
+        :param search_term: название страницы
+        :return: словарь с признаком существования страницы, ссылкой на неё и кратким описанием
+        """
+        response = self.get_session(language).get(
+            "https://" + language + ".wikipedia.org/w/api.php",
+            params={
+                "action": "query",
+                "format": "json",
+                "formatversion": 2,
+                "titles": search_term,
+                "redirects": 1,
+                "prop": "extracts|info",
+                "inprop": "url",  # ссылка на страницу
+                "exintro": 1,  # только вступление статьи (то же, что summary в wikipediaapi)
+                "explaintext": 1,
+            },
+            timeout=self.timeout)
+        response.raise_for_status()
+
+        page = response.json()["query"]["pages"][0]
+        exists = not page.get("missing", False) and not page.get("invalid", False)
+        return {
+            "exists": exists,
+            "url": page.get("fullurl", "") if exists else "",
+            "summary": page.get("extract", "") if exists else "",
+            "checked": time.time(),  # время запроса (по нему устаревает запись об отсутствии страницы)
+        }
+
+    def get(self, language: str, search_term: str):
+        """
+        Получение страницы из кэша (или из сети, если её ещё нет в кэше)
+        :param language: язык раздела Wikipedia
+        :param search_term: название страницы
+        :return: словарь с признаком существования страницы, ссылкой на неё и кратким описанием
+        """
+        key = self.cache.get_key(language, search_term.lower())
+        page = self.cache.get(key)
+
+        # отсутствующая страница могла появиться, поэтому такой результат хранится ограниченное время
+        if page is not None and not page["exists"] and time.time() - page.get("checked", 0) >= self.missing_ttl:
+            page = None
+
+        if page is None:
+            page = self.fetch(language, search_term)
+            self.cache.put(key, page)
+        return page
 
 
 def search_for_definition_on_wikipedia(*args: tuple):
@@ -238,23 +2425,24 @@ def search_for_definition_on_wikipedia(*args: tuple):
 
     search_term = " ".join(args[0])
 
-    # установка языка (используется язык, на котором говорит ассистент)
-    wiki = wikipediaapi.Wikipedia(assistant.speech_language)
-
-    # поиск страницы по запросу, чтение, открытие ссылки на страницу для получения подробной информации
-    wiki_page = wiki.page(search_term)
     try:
-        if wiki_page.exists():
-            play_voice_assistant_speech(translator.get("Here is what I found for {} on Wikipedia").format(search_term))
-            webbrowser.get().open(wiki_page.fullurl)
+        # поиск страницы по запросу, чтение, открытие ссылки на страницу для получения подробной информации
+        # (используется язык, на котором говорит ассистент, повторные запросы берутся из кэша)
+        wiki_page = wikipedia_summaries.get(assistant.speech_language, search_term)
+        if wiki_page["exists"]:
+            webbrowser.get().open(wiki_page["url"])
 
-            # чтение ассистентом первых двух предложений со страницы Wikipedia
+            # чтение ассистентом первых двух предложений со страницы Wikipedia одним ответом
             # (могут быть проблемы с мультиязычностью)
-            play_voice_assistant_speech(wiki_page.summary.split(".")[:2])
+            sentences = [sentence.strip() for sentence in wiki_page["summary"].split(".") if sentence.strip()][:2]
+            speech_queue = SpeechQueue().add(translator.get("Here is what I found for {} on Wikipedia"), search_term)
+            if sentences:
+                speech_queue.add(". ".join(sentences) + ".")
+            speech_queue.play()
         else:
             # открытие ссылки поисковика в браузере в случае, если на Wikipedia не удалось найти ничего по запросу
             play_voice_assistant_speech(translator.get(
-                "Can't find {} on Wikipedia. But here is what I found on google").format(search_term))
+                "Can't find {} on Wikipedia. But here is what I found on google"), search_term)
             url = "https://google.com/search?q=" + search_term
             webbrowser.get().open(url)
 
@@ -265,6 +2453,58 @@ def search_for_definition_on_wikipedia(*args: tuple):
         return
 
 
+class TextTranslator:
+    """
+    Общий переводчик Google Translate с постоянным кэшем переводов (исходный язык, язык перевода, текст)
+    и пакетным переводом нескольких фраз одним запросом
+    """
+
+    def __init__(self, cache: PersistentCache, timeout: float = 5):
+        self.cache = cache
+        self.timeout = timeout
+        self.translator = None
+        self.lock = threading.Lock()
+
+    def get_translator(self):
+        """
+        Получение переводчика (создаётся один раз)
+        """
+        if self.translator is None:
+            self.translator = googletrans.Translator(timeout=self.timeout)
+        return self.translator
+
+    def translate_many(self, texts: list, src: str, dest: str):
+        """
+        Перевод нескольких фраз: сохранённые переводы берутся из кэша, остальные переводятся одним запросом
+        :param texts: фразы, которые требуется перевести
+        :param src: с какого языка
+        :param dest: на какой язык
+        :return: список переводов в том же порядке
+        """
+        keys = [self.cache.get_key(src, dest, text) for text in texts]
+        translations = [self.cache.get(key) for key in keys]
+        missing = [index for index, translation in enumerate(translations) if translation is None]
+
+        if missing:
+            with self.lock:
+                results = self.get_translator().translate([texts[index] for index in missing], src=src, dest=dest)
+            for index, result in zip(missing, results):
+                translations[index] = result.text
+                self.cache.put(keys[index], result.text)
+
+        return translations
+
+    def translate(self, text: str, src: str, dest: str):
+        """
+        Перевод одной фразы
+        :param text: что перевести
+        :param src: с какого языка
+        :param dest: на какой язык
+        :return: перевод фразы
+        """
+        return self.translate_many([text], src, dest)[0]
+
+
 def get_translation(*args: tuple):
     """
     Получение перевода текста с одного языка на другой (в данном случае с изучаемого на родной язык или обратно)
@@ -273,36 +2513,37 @@ def get_translation(*args: tuple):
     if not args[0]: return
 
     search_term = " ".join(args[0])
-    google_translator = googletrans.Translator()
-    translation_result = ""
 
-    old_assistant_language = assistant.speech_language
+    # запрос переводится целиком: союз может быть частью устойчивого выражения ("salt and pepper")
+    phrases = [search_term]
+
     try:
         # если язык речи ассистента и родной язык пользователя различаются, то перевод выполняется на родной язык
         if assistant.speech_language != person.native_language:
-            translation_result = google_translator.translate(search_term,  # что перевести
-                                                      src=person.target_language,  # с какого языка
-                                                      dest=person.native_language)  # на какой язык
+            translation_results = text_translator.translate_many(phrases,  # что перевести
+                                                                 src=person.target_language,  # с какого языка
+                                                                 dest=person.native_language)  # на какой язык
 
             play_voice_assistant_speech("The translation for {} in Russian is".format(search_term))
 
             # смена голоса ассистента на родной язык пользователя (чтобы можно было произнести перевод)
-            assistant.speech_language = person.native_language
-            setup_assistant_voice()
+            set_voice(person.native_language)
 
         # если язык речи ассистента и родной язык пользователя одинаковы, то перевод выполняется на изучаемый язык
         else:
-            translation_result = google_translator.translate(search_term,  # что перевести
-                                                      src=person.native_language,  # с какого языка
-                                                      dest=person.target_language)  # на какой язык
+            translation_results = text_translator.translate_many(phrases,  # что перевести
+                                                                 src=person.native_language,  # с какого языка
+                                                                 dest=person.target_language)  # на какой язык
             play_voice_assistant_speech("По-английски {} будет как".format(search_term))
 
             # смена голоса ассистента на изучаемый язык пользователя (чтобы можно было произнести перевод)
-            assistant.speech_language = person.target_language
-            setup_assistant_voice()
+            set_voice(person.target_language)
 
-        # произнесение перевода
-        play_voice_assistant_speech(translation_result.text)
+        # произнесение всех переводов одним ответом
+        speech_queue = SpeechQueue()
+        for translation_result in translation_results:
+            speech_queue.add(translation_result)
+        speech_queue.play()
 
     # отлов ошибок с последующим выводом без остановки программы
     except:
@@ -310,9 +2551,151 @@ def get_translation(*args: tuple):
         traceback.print_exc()
 
     finally:
-        # возвращение прежних настроек голоса помощника
-        assistant.speech_language = old_assistant_language
-        setup_assistant_voice()
+        # возвращение прежнего голоса помощника (язык ассистента при переводе не меняется)
+        set_voice(assistant.speech_language)
+
+
+class WeatherService:
+    """
+    Долгоживущий клиент OpenWeatherMap с кэшем наблюдений по городам:
+    свежие данные отдаются без запроса в сеть, устаревшие - сразу, с обновлением в фоне
+    """
+
+    def __init__(self, api_key: str, ttl: float = 600, max_stale: float = 3600,
+                 cache_file: str = os.path.join("cache", "weather.json"), timeout: float = 5):
+        self.api_key = api_key
+        self.ttl = ttl  # сколько секунд наблюдение считается свежим
+        self.max_stale = max_stale  # сколько секунд после этого устаревшее наблюдение ещё можно озвучить
+        self.cache_file = cache_file
+        self.timeout = timeout
+        self.weather_manager = None
+        self.entries = {}  # город -> {"time": время получения, "weather": данные о погоде}
+        self.refreshing = set()  # города, данные по которым сейчас обновляются в фоне
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        Загрузка сохранённых наблюдений с диска (чтобы кэш переживал перезапуск)
+        """
+        try:
+            with open(self.cache_file, "r", encoding="UTF-8") as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        """
+        Сохранение наблюдений на диск (через временный файл, чтобы не повредить кэш при сбое)
+        """
+        with self.lock:
+            entries = dict(self.entries)
+        with self.save_lock:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            temporary_file = self.cache_file + ".tmp"
+            with open(temporary_file, "w", encoding="UTF-8") as file:
+                json.dump(entries, file, ensure_ascii=False)
+            os.replace(temporary_file, self.cache_file)
+
+    def get_weather_manager(self):
+        """
+        Получение менеджера погоды (клиент и его HTTP-соединение создаются один раз)
+        """
+        if self.weather_manager is None:
+            config = pyowm_config.get_default_config()
+            config["connection"]["timeout_secs"] = self.timeout
+            self.weather_manager = pyowm.OWM(self.api_key, config).weather_manager()
+        return self.weather_manager
+
+    def fetch(self, city_name: str):
+        """
+        Запрос данных о текущем состоянии погоды и сохранение их в кэш
+        :param city_name: название города
+        :return: данные о погоде
+        """
+        weather = self.get_weather_manager().weather_at_place(city_name).weather
+
+        # разбивание данных на части для удобства работы с ними
+        weather_data = {
+            "status": weather.detailed_status,
+            "temperature": weather.temperature("celsius")["temp"],
+            "wind_speed": weather.wind()["speed"],
+            "pressure": int(weather.pressure["press"] / 1.333),  # переведено из гПА в мм рт.ст.
+        }
+
+        with self.lock:
+            self.entries[city_name.lower()] = {"time": time.time(), "weather": weather_data}
+        self.save()
+        return weather_data
+
+    def refresh_async(self, city_name: str):
+        """
+        Фоновое обновление данных о погоде (повторный запрос по тому же городу не запускается)
+        :param city_name: название города
+        """
+        with self.lock:
+            if city_name.lower() in self.refreshing:
+                return
+            self.refreshing.add(city_name.lower())
+
+        def refresh():
+            try:
+                self.fetch(city_name)
+            except:
+                traceback.print_exc()
+            finally:
+                with self.lock:
+                    self.refreshing.discard(city_name.lower())
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def prefetch(self, city_name: str):
+        """
+        Заблаговременный запрос данных о погоде в фоне, если в кэше нет свежих данных
+        :param city_name: название города
+        """
+        with self.lock:
+            entry = self.entries.get(city_name.lower())
+        if entry is None or time.time() - entry["time"] >= self.ttl:
+            self.refresh_async(city_name)
+
+    def get(self, city_name: str):
+        """
+        Получение данных о погоде: из кэша, если они достаточно свежие, иначе - из сети
+        :param city_name: название города
+        :return: данные о погоде
+        """
+        with self.lock:
+            entry = self.entries.get(city_name.lower())
+        age = time.time() - entry["time"] if entry else None
+
+        if age is not None and age < self.ttl:
+            with self.lock:
+                self.hits += 1
+            return entry["weather"]
+
+        # устаревшие данные озвучиваются сразу, а свежие запрашиваются к следующему разу
+        if age is not None and age < self.ttl + self.max_stale:
+            with self.lock:
+                self.stale_hits += 1
+            self.refresh_async(city_name)
+            return entry["weather"]
+
+        with self.lock:
+            self.misses += 1
+        return self.fetch(city_name)
+
+    def get_stats(self):
+        """
+        Получение статистики кэша
+        """
+        with self.lock:
+            return {"cities": len(self.entries), "hits": self.hits, "stale_hits": self.stale_hits,
+                    "misses": self.misses, "refreshing": len(self.refreshing)}
 
 
 def get_weather_forecast(*args: tuple):
@@ -328,14 +2711,8 @@ def get_weather_forecast(*args: tuple):
         city_name = person.home_city
 
     try:
-        # использование API-ключа, помещённого в .env-файл по примеру WEATHER_API_KEY = "01234abcd....."
-        weather_api_key = os.getenv("9341ce5d5741e2c7e7ed34b75a4384a5")
-        open_weather_map = OWM(weather_api_key)
-
-        # запрос данных о текущем состоянии погоды
-        weather_manager = open_weather_map.weather_manager()
-        observation = weather_manager.weather_at_place(city_name)
-        weather = observation.weather
+        # запрос данных о текущем состоянии погоды (недавние данные берутся из кэша)
+        weather = weather_service.get(city_name)
 
     # отлов ошибок с последующим выводом без остановки программы
     except:
@@ -343,11 +2720,10 @@ def get_weather_forecast(*args: tuple):
         traceback.print_exc()
         return
 
-    # разбивание данных на части для удобства работы с ними
-    status = weather.detailed_status
-    temperature = weather.temperature('celsius')["temp"]
-    wind_speed = weather.wind()["speed"]
-    pressure = int(weather.pressure["press"] / 1.333)  # переведено из гПА в мм рт.ст.
+    status = weather["status"]
+    temperature = weather["temperature"]
+    wind_speed = weather["wind_speed"]
+    pressure = weather["pressure"]
 
     # вывод логов
     print(colored("Weather in " + city_name +
@@ -356,11 +2732,46 @@ def get_weather_forecast(*args: tuple):
                   "\n * Temperature (Celsius): " + str(temperature) +
                   "\n * Pressure (mm Hg): " + str(pressure), "yellow"))
 
-    # озвучивание текущего состояния погоды ассистентом (здесь для мультиязычности требуется дополнительная работа)
-    play_voice_assistant_speech(translator.get("It is {0} in {1}").format(status, city_name))
-    play_voice_assistant_speech(translator.get("The temperature is {} degrees Celsius").format(str(temperature)))
-    play_voice_assistant_speech(translator.get("The wind speed is {} meters per second").format(str(wind_speed)))
-    play_voice_assistant_speech(translator.get("The pressure is {} mm Hg").format(str(pressure)))
+    # озвучивание текущего состояния погоды ассистентом одним ответом
+    # (здесь для мультиязычности требуется дополнительная работа)
+    speech_queue = SpeechQueue()
+    speech_queue.add(translator.get("It is {0} in {1}"), status, city_name)
+    speech_queue.add(translator.get("The temperature is {} degrees Celsius"), str(temperature))
+    speech_queue.add(translator.get("The wind speed is {} meters per second"), str(wind_speed))
+    speech_queue.add(translator.get("The pressure is {} mm Hg"), str(pressure))
+    speech_queue.play()
+
+
+def prefetch_weather_forecast(args: list):
+    """
+    Заблаговременный запрос погоды по промежуточному результату распознавания
+    :param args: город, по которому должен выполняться запрос
+    """
+    weather_service.prefetch(args[0] if args else person.home_city)
+
+
+def prefetch_definition_on_wikipedia(args: list):
+    """
+    Заблаговременная загрузка страницы Wikipedia в кэш по промежуточному результату распознавания
+    :param args: фраза поискового запроса
+    """
+    if args:
+        wikipedia_summaries.get(assistant.speech_language, " ".join(args))
+
+
+def prefetch_translation(args: list):
+    """
+    Заблаговременный перевод в кэш по промежуточному результату распознавания
+    :param args: фраза, которую требуется перевести
+    """
+    if not args:
+        return
+
+    # в кэш попадает перевод всего запроса - именно его запросит get_translation
+    if assistant.speech_language != person.native_language:
+        text_translator.translate(" ".join(args), src=person.target_language, dest=person.native_language)
+    else:
+        text_translator.translate(" ".join(args), src=person.native_language, dest=person.target_language)
 
 
 def change_language(*args: tuple):
@@ -369,6 +2780,13 @@ def change_language(*args: tuple):
     """
     assistant.speech_language = "ru" if assistant.speech_language == "en" else "en"
     setup_assistant_voice()
+
+    # модели и кэш речи общие для всех сессий, поэтому удалённая сессия только подгружает модель нового языка
+    if get_session().speak_locally:
+        vosk_models.switch_language(assistant.speech_language)
+        speech_cache.prerender_async(get_prerendered_phrases())
+    else:
+        vosk_models.preload(assistant.speech_language)
     print(colored("Language switched to " + assistant.speech_language, "cyan"))
 
 
@@ -397,7 +2815,7 @@ def run_person_through_social_nets_databases(*args: tuple):
     fb_url = "https://www.facebook.com/public/" + fb_search_term
     webbrowser.get().open(fb_url)
 
-    play_voice_assistant_speech(translator.get("Here is what I found for {} on social nets").format(google_search_term))
+    play_voice_assistant_speech(translator.get("Here is what I found for {} on social nets"), google_search_term)
 
 
 def toss_coin(*args: tuple):
@@ -412,7 +2830,223 @@ def toss_coin(*args: tuple):
 
     tails = flips_count - heads
     winner = "Tails" if tails > heads else "Heads"
-    play_voice_assistant_speech(translator.get(winner) + " " + translator.get("won"))
+    play_voice_assistant_speech(get_coin_toss_result(winner))
+
+
+def get_coin_toss_result(winner: str):
+    """
+    Получение фразы с результатом подбрасывания монетки
+    :param winner: "Heads" или "Tails"
+    """
+    return translator.get(winner) + " " + translator.get("won")
+
+
+def get_prerendered_phrases():
+    """
+    Получение фраз для заблаговременного синтеза на текущем языке ассистента: неизменные фразы из translations.json,
+    приветствия и прощания с именем владельца и оба результата подбрасывания монетки
+    :return: список фраз
+    """
+    phrases = translator.get_all(assistant.speech_language)
+    if person.name:
+        phrases += [translator.get(phrase).format(person.name) for phrase in greeting_phrases + farewell_phrases]
+    phrases += [get_coin_toss_result(winner) for winner in ("Heads", "Tails")]
+    return phrases
+
+
+class CommandMatch:
+    """
+    Найденная в распознанной фразе команда
+    """
+
+    def __init__(self, handler, phrase: tuple, position: int, tokens: list, distance: int = 0):
+        self.handler = handler
+        self.phrase = phrase  # ключевая фраза команды (кортеж слов)
+        self.position = position  # индекс первого слова команды во фразе
+        self.tokens = tokens
+        self.distance = distance  # расстояние редактирования (0 - точное совпадение)
+
+    @property
+    def args(self):
+        """
+        Аргументы команды - слова, идущие после ключевой фразы
+        """
+        return self.tokens[self.position + len(self.phrase):]
+
+
+def get_edit_distance(first: str, second: str, max_distance: int):
+    """
+    Расчёт расстояния Левенштейна с досрочным выходом при превышении порога
+    :param first: первое слово
+    :param second: второе слово
+    :param max_distance: максимальное интересующее расстояние
+    :return: расстояние или max_distance + 1, если слова различаются сильнее
+    """
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+
+    # считаются только клетки не дальше max_distance от диагонали (остальные заведомо больше порога)
+    too_far = max_distance + 1
+    previous_row = [j if j <= max_distance else too_far for j in range(len(second) + 1)]
+    for i, first_char in enumerate(first, 1):
+        start, end = max(1, i - max_distance), min(len(second), i + max_distance)
+        current_row = [too_far] * (len(second) + 1)
+        current_row[0] = i if i <= max_distance else too_far
+        row_minimum = current_row[0]
+        for j in range(start, end + 1):
+            distance = min(previous_row[j] + 1, current_row[j - 1] + 1,
+                           previous_row[j - 1] + (first_char != second[j - 1]))
+            current_row[j] = distance
+            if distance < row_minimum:
+                row_minimum = distance
+        if row_minimum > max_distance:
+            return too_far
+        previous_row = current_row
+
+    return min(previous_row[-1], too_far)
+
+
+class CommandRouter:
+    """
+    Поиск команды в распознанной фразе по заранее построенному индексу ключевых слов
+    (вместо перебора всех команд для каждой фразы)
+    """
+
+    def __init__(self, commands_table: dict, min_fuzzy_length: int = 5, min_similarity: float = 0.875,
+                 exact_handlers: tuple = ()):
+        self.min_fuzzy_length = min_fuzzy_length  # короткие слова нечётко не сравниваются (слишком много ложных совпадений)
+        self.min_similarity = min_similarity  # доля совпадающих букв (1 - правки / длина слова) для нечёткого совпадения
+        self.phrases = {}  # первое слово ключевой фразы -> [(фраза, приоритет, обработчик)]
+        self.deletions = {}  # слово без 1-2 букв -> первые слова ключевых фраз (для нечёткого поиска)
+        # команды, которые выполняются, только если фраза целиком совпадает с ключевой (например, выход)
+        self.exact_handlers = set(exact_handlers)
+
+        # приоритет команды определяется её порядком в таблице
+        for priority, (keys, handler) in enumerate(commands_table.items()):
+            for key in keys:
+                phrase = tuple(key.lower().split())
+                self.phrases.setdefault(phrase[0], []).append((phrase, priority, handler))
+
+        # при одинаковом начале сначала проверяются более длинные фразы, затем более приоритетные
+        for candidates in self.phrases.values():
+            candidates.sort(key=lambda candidate: (-len(candidate[0]), candidate[1]))
+
+        # команды из exact_handlers нечётко не ищутся
+        for keyword, candidates in self.phrases.items():
+            if any(handler in exact_handlers for _, _, handler in candidates):
+                continue
+            # слово длины n сравнивается с ключевыми словами длины от n - 2 до n + 2
+            for deletion in self.get_deletions(keyword, self.get_max_distance(len(keyword) + 2)):
+                self.deletions.setdefault(deletion, set()).add(keyword)
+
+        self.find_similar_keyword = functools.lru_cache(maxsize=4096)(self.find_similar_keyword)
+
+    def get_max_distance(self, length: int):
+        """
+        Допустимое количество правок для слова заданной длины (не больше двух)
+        """
+        return min(2, int(length * (1 - self.min_similarity) + 1e-9))
+
+    @staticmethod
+    def get_deletions(word: str, max_distance: int):
+        """
+        Получение всех вариантов слова без не более чем max_distance букв (включая само слово).
+        Если расстояние между словами не больше max_distance, у них есть общий вариант,
+        поэтому поиск по вариантам не зависит от количества команд
+        """
+        deletions, current = {word}, {word}
+        for _ in range(max_distance):
+            current = {variant[:index] + variant[index + 1:] for variant in current for index in range(len(variant))}
+            deletions |= current
+        return deletions
+
+    def find_similar_keyword(self, word: str):
+        """
+        Нечёткий поиск ключевого слова, похожего на неверно распознанное слово
+        :param word: слово из распознанной фразы
+        :return: (ключевое слово, расстояние) или None
+        """
+        max_distance = self.get_max_distance(len(word))
+        if len(word) < self.min_fuzzy_length or max_distance == 0:
+            return None
+
+        candidates = set()
+        for deletion in self.get_deletions(word, max_distance):
+            candidates.update(self.deletions.get(deletion, ()))
+
+        # при равном расстоянии побеждает ключевое слово более приоритетной команды
+        best = None
+        for keyword in sorted(candidates, key=lambda candidate: (self.phrases[candidate][0][1], candidate)):
+            if abs(len(keyword) - len(word)) > max_distance:
+                continue
+            distance = get_edit_distance(word, keyword, max_distance)
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (keyword, distance)
+        return best
+
+    def match_at(self, tokens: list, position: int, keyword: str, distance: int = 0):
+        """
+        Проверка ключевых фраз, начинающихся с заданного слова, в указанной позиции фразы
+        """
+        for phrase, priority, handler in self.phrases.get(keyword, ()):
+            # "stop" в "how do i stop smoking" - не команда выхода
+            if handler in self.exact_handlers and (position != 0 or len(tokens) != len(phrase)):
+                continue
+            if tuple(tokens[position + 1:position + len(phrase)]) == phrase[1:]:
+                return CommandMatch(handler, phrase, position, tokens, distance)
+        return None
+
+    def match(self, tokens: list):
+        """
+        Поиск команды во всей фразе: побеждает самое раннее точное совпадение,
+        и только если его нет - самое близкое нечёткое (команды из exact_handlers - только вся фраза целиком)
+        :param tokens: слова распознанной фразы
+        :return: найденная команда или None
+        """
+        tokens = [token.lower() for token in tokens if token]
+
+        for position, token in enumerate(tokens):
+            if token in self.phrases:
+                command_match = self.match_at(tokens, position, token)
+                if command_match is not None:
+                    return command_match
+
+        best_match = None
+        for position, token in enumerate(tokens):
+            similar = self.find_similar_keyword(token)
+            if similar is None or (best_match is not None and similar[1] >= best_match.distance):
+                continue
+            command_match = self.match_at(tokens, position, *similar)
+            if command_match is not None:
+                best_match = command_match
+
+        return best_match
+
+    def find_handler(self, command_name: str):
+        """
+        Поиск обработчика команды по одному слову
+        :param command_name: название команды
+        :return: обработчик команды или None
+        """
+        command_match = self.match([command_name])
+        return command_match.handler if command_match is not None else None
+
+
+def execute_command(voice_input: str):
+    """
+    Выполнение команды из распознанной фразы (ключевое слово может стоять в любом месте фразы)
+    :param voice_input: распознанная фраза
+    """
+    # новая команда снова может говорить (прерывание относилось к ответу предыдущей команды)
+    if get_session().speak_locally:
+        speech_interrupted.clear()
+
+    with turn_profiler.profile(voice_input), stage_metrics.timed("turn"):
+        # отделение комманд от дополнительной информации (аргументов, идущих после ключевой фразы)
+        with stage_metrics.timed("routing"):
+            command_match = command_router.match(voice_input.split(" "))
+        if command_match is not None:
+            skill_executor.execute(command_match.handler, [str(input_part) for input_part in command_match.args])
 
 
 def execute_command_with_name(command_name: str, *args: list):
@@ -422,11 +3056,10 @@ def execute_command_with_name(command_name: str, *args: list):
     :param args: аргументы, которые будут переданы в метод
     :return:
     '''
-    for key in commands.keys():
-        if command_name in key:
-            commands[key](*args)
-        else:
-            pass
+    with stage_metrics.timed("routing"):
+        handler = command_router.find_handler(command_name)
+    if handler is not None:
+        skill_executor.execute(handler, *args)
 
 
 # переменные и вспомогательные
@@ -443,30 +3076,441 @@ commands = {
     ("toss", "coin", "монета", "подбрось"): toss_coin,
 }
 
-if __name__ == "__main__":
+# индекс ключевых слов команд (строится один раз при запуске)
+command_router = CommandRouter(commands, exact_handlers=(play_farewell_and_quit,))
 
-    # инициализация инструментов распознования и ввода речи
-    recognizer = speech_recognition.Recognizer()
-    microphone = speech_recognition.Recognizer()
+# допустимое время выполнения сетевых навыков в секундах
+skill_deadlines = {
+    search_for_term_on_google: 8,
+    search_for_definition_on_wikipedia: 6,
+    get_translation: 5,
+    get_weather_forecast: 5,
+}
+
+# пул для сетевых навыков (чтобы медленный ответ сервиса не блокировал ассистента)
+skill_executor = SkillExecutor(skill_deadlines)
+stage_metrics.register_stats("skills", skill_executor.get_stats)
+
+# предварительная загрузка данных навыков во время записи фразы
+speculative_prefetcher = SpeculativePrefetcher({
+    get_weather_forecast: prefetch_weather_forecast,
+    search_for_definition_on_wikipedia: prefetch_definition_on_wikipedia,
+    get_translation: prefetch_translation,
+})
+stage_metrics.register_stats("prefetch", speculative_prefetcher.get_stats)
+
+def get_model_sample_rate(model_path: str, default_sample_rate: int = 16000):
+    """
+    Получение частоты дискретизации, на которой обучена модель Vosk (из conf/mfcc.conf)
+    :param model_path: путь к каталогу модели
+    :param default_sample_rate: частота по умолчанию, если в модели она не указана
+    """
+    try:
+        with open(os.path.join(model_path, "conf", "mfcc.conf"), "r", encoding="UTF-8") as file:
+            for line in file:
+                if line.startswith("--sample-frequency="):
+                    return int(float(line.split("=", 1)[1]))
+    except (OSError, ValueError):
+        pass
+    return default_sample_rate
+
+
+def read_wav_file(file_path):
+    """
+    Чтение wav-файла в буфер с аудио
+    :param file_path: путь к файлу (или файловый объект)
+    """
+    with wave.open(file_path, "rb") as wave_audio_file:
+        return AudioBuffer(wave_audio_file.readframes(wave_audio_file.getnframes()), wave_audio_file.getframerate(),
+                           wave_audio_file.getsampwidth(), wave_audio_file.getnchannels())
+
+
+def convert_audio(audio_buffer: AudioBuffer, sample_rate: int):
+    """
+    Приведение аудио к формату модели Vosk: моно, 16 бит, нужная частота дискретизации
+    :param audio_buffer: исходное аудио
+    :param sample_rate: нужная частота дискретизации
+    :return: исходный буфер, если преобразование не требуется, иначе - новый буфер
+    """
+    frames, sample_width = audio_buffer.to_bytes(), audio_buffer.sample_width
+    if audio_buffer.channels == 1 and sample_width == 2 and audio_buffer.sample_rate == sample_rate:
+        return audio_buffer
+
+    if sample_width != 2:
+        frames = audioop.lin2lin(frames, sample_width, 2)
+        sample_width = 2
+    if audio_buffer.channels == 2:
+        frames = audioop.tomono(frames, sample_width, 0.5, 0.5)
+    elif audio_buffer.channels != 1:
+        raise ValueError("Unsupported number of channels: {}".format(audio_buffer.channels))
+    if audio_buffer.sample_rate != sample_rate:
+        frames, _ = audioop.ratecv(frames, sample_width, 1, audio_buffer.sample_rate, sample_rate, None)
+
+    return AudioBuffer(frames, sample_rate, sample_width)
+
+
+# язык и частота дискретизации модели в процессе пакетного распознавания
+batch_language = ""
+batch_sample_rate = 16000
+
+
+def init_batch_worker(language: str, models_directory: str):
+    """
+    Подготовка процесса пакетного распознавания: модель загружается один раз на процесс
+    :param language: язык модели
+    :param models_directory: каталог с моделями Vosk
+    """
+    global vosk_models, batch_language, batch_sample_rate
+
+    # stdout основного процесса может быть JSONL-выводом результатов, поэтому сообщения процесса идут в stderr
+    sys.stdout = sys.stderr
+
+    vosk_models = VoskModelRegistry(models_directory)
+    vosk_models.get_model(language)
+    batch_language = language
+    batch_sample_rate = get_model_sample_rate(vosk_models.get_model_path(language))
+
+
+def transcribe_file(file_path: str):
+    """
+    Распознавание одного wav-файла и поиск команды в распознанной фразе (без её выполнения)
+    :param file_path: путь к файлу
+    :return: словарь с расшифровкой, найденной командой и замерами времени
+    """
+    timings = {}
+    start_time = time.perf_counter()
+    try:
+        audio_buffer = read_wav_file(file_path)
+        timings["read"] = time.perf_counter() - start_time
+
+        stage_start = time.perf_counter()
+        model_audio_buffer = convert_audio(audio_buffer, batch_sample_rate)
+        timings["convert"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        # ошибка распознавания не перехватывается, а попадает в поле "error" результата
+        transcript, confidence = run_offline_recognition(model_audio_buffer, batch_language)
+        timings["recognize"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        command_match = command_router.match(transcript.split(" "))
+        timings["route"] = time.perf_counter() - stage_start
+    except Exception as error:
+        return {"file": file_path, "error": repr(error)}
+
+    timings["total"] = time.perf_counter() - start_time
+    return {
+        "file": file_path,
+        "duration": audio_buffer.get_duration(),
+        "transcript": transcript,
+        "confidence": confidence,
+        "command": command_match.handler.__name__ if command_match is not None else None,
+        "args": command_match.args if command_match is not None else [],
+        "timings": timings,
+    }
+
+
+def collect_wav_files(paths: list):
+    """
+    Сбор списка wav-файлов (каталоги обходятся рекурсивно)
+    :param paths: пути к файлам и каталогам
+    """
+    wav_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, file_names in sorted(os.walk(path)):
+                wav_files.extend(os.path.join(directory, file_name) for file_name in sorted(file_names)
+                                 if file_name.lower().endswith(".wav"))
+        else:
+            wav_files.append(path)
+    return wav_files
+
+
+def run_batch_transcription(paths: list, output_file: str, language: str, workers: int = None,
+                            models_directory: str = "models"):
+    """
+    Пакетное распознавание wav-файлов в пуле процессов с записью результатов в JSONL по мере готовности
+    :param paths: пути к wav-файлам и каталогам с ними
+    :param output_file: путь к JSONL-файлу ("-" - вывод в консоль)
+    :param language: язык модели Vosk
+    :param workers: количество процессов (по умолчанию - по количеству ядер)
+    :param models_directory: каталог с моделями Vosk
+    """
+    # без модели пакетное распознавание невозможно: ненулевой код выхода, чтобы ошибку заметили скрипты и CI
+    if not VoskModelRegistry(models_directory).has_model(language):
+        print(colored("Please download the model from:\n"
+                      "https://alphacephei.com/vosk/models и распакуйте как 'model' в нужной папке.", "red"),
+              file=sys.stderr)
+        sys.exit(1)
+
+    wav_files = collect_wav_files(paths)
+    start_time = time.perf_counter()
+    audio_duration, failed = 0.0, 0
+
+    output = sys.stdout if output_file == "-" else open(output_file, "w", encoding="UTF-8")
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_batch_worker,
+                                                    initargs=(language, models_directory)) as executor:
+            for result in executor.map(transcribe_file, wav_files, chunksize=4):
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+                audio_duration += result.get("duration", 0.0)
+                failed += "error" in result
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed_time = time.perf_counter() - start_time
+    print(colored("Transcribed {} files ({} failed): {:.1f} s of audio in {:.1f} s ({:.1f}x real time)".format(
+        len(wav_files), failed, audio_duration, elapsed_time, audio_duration / max(elapsed_time, 1e-9)), "cyan"),
+        file=sys.stderr)
+
+
+class SessionRegistry:
+    """
+    Сессии пользователей сервера (неактивные сессии удаляются)
+    """
+
+    def __init__(self, session_ttl: float = 3600):
+        self.session_ttl = session_ttl  # через сколько секунд бездействия сессия удаляется
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create(self, owner_data: dict, assistant_data: dict):
+        """
+        Создание сессии с данными владельца и настройками ассистента (не указанные поля берутся из сессии по умолчанию)
+        :param owner_data: данные владельца (name, home_city, native_language, target_language)
+        :param assistant_data: настройки ассистента (name, sex, speech_language)
+        :return: новая сессия
+        """
+        owner, assistant_settings = OwnerPerson(), VoiceAssistant()
+        for target, source, data in ((owner, default_session.owner, owner_data),
+                                     (assistant_settings, default_session.assistant, assistant_data)):
+            for attribute, value in vars(source).items():
+                setattr(target, attribute, value)
+            for attribute, value in data.items():
+                # изменять можно только существующие поля настроек
+                if hasattr(type(target), attribute) and isinstance(value, str):
+                    setattr(target, attribute, value)
+
+        session = AssistantSession(owner, assistant_settings, speak_locally=False)
+        session.run(setup_assistant_voice)
+        with self.lock:
+            self.remove_expired()
+            self.sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str):
+        """
+        Получение сессии по идентификатору
+        :return: сессия или None, если сессия не найдена или уже завершена
+        """
+        with self.lock:
+            self.remove_expired()
+            session = self.sessions.get(session_id)
+        return session if session is not None and not session.closed else None
+
+    def remove(self, session_id: str):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def remove_expired(self):
+        """
+        Удаление завершённых и неактивных сессий (вызывается под блокировкой)
+        """
+        now = time.monotonic()
+        for session_id in [session_id for session_id, session in self.sessions.items()
+                           if session.closed or now - session.last_activity > self.session_ttl]:
+            del self.sessions[session_id]
+
+
+def process_voice_input(voice_input: str = "", audio_buffer: AudioBuffer = None):
+    """
+    Обработка фразы пользователя от имени текущей сессии: распознавание (если прислано аудио) и выполнение команды
+    :param voice_input: текст команды
+    :param audio_buffer: аудио с командой
+    :return: словарь с распознанной фразой и ответами ассистента
+    """
+    session = get_session()
+    session.replies = []
+    if audio_buffer is not None:
+        voice_input = recognize_audio(audio_buffer)
+    voice_input = voice_input.lower().strip()
+
+    if voice_input:
+        execute_command(voice_input)
+    return {"transcript": voice_input, "replies": session.replies, "closed": session.closed}
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Выдача метрик ассистента:
+     * GET /metrics - задержки этапов и счётчики компонентов в текстовом формате Prometheus;
+     * GET /metrics.json - задержки этапов с оценками квантилей и счётчики компонентов в JSON
+    """
+
+    def send_body(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, data: dict):
+        self.send_body(status, json.dumps(data, ensure_ascii=False).encode("UTF-8"), "application/json; charset=utf-8")
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.send_body(200, stage_metrics.to_prometheus().encode("UTF-8"), "text/plain; version=0.0.4")
+        elif self.path == "/metrics.json":
+            self.send_json(200, stage_metrics.get_report())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+
+def start_metrics_server(host: str, port: int):
+    """
+    Запуск сервера метрик в фоне (для режима с микрофоном)
+    :param host: адрес сервера
+    :param port: порт сервера
+    """
+    server = http.server.ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="metrics_server", daemon=True).start()
+    print(colored("Serving metrics on http://{}:{}/metrics".format(host, port), "cyan"))
+    return server
 
-    # инициализация инструментов ввода речи
-    ttsEngine = pyttsx3.init()
+
+class AssistantRequestHandler(MetricsRequestHandler):
+    """
+    Обработка запросов к серверу ассистента (кроме метрик):
+     * POST /sessions - создание сессии (JSON с полями owner и assistant);
+     * POST /sessions/<id>/text - выполнение команды из текста (JSON с полем text);
+     * POST /sessions/<id>/audio - распознавание и выполнение команды из wav-файла в теле запроса;
+     * DELETE /sessions/<id> - завершение сессии
+    """
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        path = self.path.strip("/").split("/")
+        try:
+            if path == ["sessions"]:
+                data = json.loads(self.read_body() or b"{}")
+                session = sessions.create(data.get("owner", {}), data.get("assistant", {}))
+                self.send_json(201, {"session_id": session.session_id})
+                return
+
+            if len(path) != 3 or path[0] != "sessions" or path[2] not in ("text", "audio"):
+                self.send_json(404, {"error": "not found"})
+                return
+
+            session = sessions.get(path[1])
+            if session is None:
+                self.send_json(404, {"error": "session not found"})
+                return
+
+            if path[2] == "text":
+                result = session.run(process_voice_input, json.loads(self.read_body())["text"])
+            else:
+                # аудио приводится к формату микрофона: моно, 16 бит, 16 кГц
+                audio_buffer = convert_audio(read_wav_file(io.BytesIO(self.read_body())), 16000)
+                result = session.run(process_voice_input, "", audio_buffer)
+            self.send_json(200, result)
+
+        except (ValueError, KeyError, wave.Error, EOFError) as error:
+            self.send_json(400, {"error": repr(error)})
+        except Exception as error:
+            traceback.print_exc()
+            self.send_json(500, {"error": repr(error)})
+
+    def do_DELETE(self):
+        path = self.path.strip("/").split("/")
+        if len(path) == 2 and path[0] == "sessions" and sessions.remove(path[1]):
+            self.send_json(200, {"closed": True})
+        else:
+            self.send_json(404, {"error": "session not found"})
+
+
+def run_server(host: str, port: int):
+    """
+    Запуск локального сервера ассистента (каждый запрос обрабатывается в отдельном потоке)
+    :param host: адрес сервера
+    :param port: порт сервера
+    """
+    server = http.server.ThreadingHTTPServer((host, port), AssistantRequestHandler)
+    print(colored("Serving voice assistant on http://{}:{}".format(host, port), "cyan"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Голосовой ассистент")
+    parser.add_argument("--compile-translations", action="store_true",
+                        help="подготовить таблицу переводов для быстрой загрузки и выйти")
+    parser.add_argument("--transcribe", nargs="+", metavar="PATH",
+                        help="распознать wav-файлы (или каталоги с ними) через Vosk и выйти")
+    parser.add_argument("--output", default="-", help="JSONL-файл для результатов распознавания (по умолчанию - консоль)")
+    parser.add_argument("--language", default="ru", help="язык модели Vosk для распознавания файлов")
+    parser.add_argument("--workers", type=int, default=None, help="количество процессов для распознавания файлов")
+    parser.add_argument("--serve", action="store_true",
+                        help="запустить локальный HTTP-сервер для нескольких пользователей вместо микрофона")
+    parser.add_argument("--host", default="127.0.0.1", help="адрес HTTP-сервера")
+    parser.add_argument("--port", type=int, default=8765, help="порт HTTP-сервера")
+    parser.add_argument("--metrics-file", default="",
+                        help="JSON-файл для периодического сохранения задержек этапов и счётчиков компонентов")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="порт для выдачи метрик в формате Prometheus в режиме с микрофоном (0 - не выдавать)")
+    parser.add_argument("--profile-slow-turns", type=float, default=0.0, metavar="SECONDS",
+                        help="снимать стеки вызовов фраз, которые обрабатываются дольше заданного времени")
+    arguments = parser.parse_args()
+
+    if arguments.transcribe:
+        run_batch_transcription(arguments.transcribe, arguments.output, arguments.language, arguments.workers)
+        quit()
+
+    if arguments.compile_translations:
+        Translation.compile()
+        print(colored("Translations compiled to " + Translation.compiled_file, "cyan"))
+        quit()
+
+    # замеры задержек этапов и профилирование медленных фраз
+    turn_profiler.threshold = arguments.profile_slow_turns
+    if arguments.metrics_file:
+        stage_metrics.save_periodically(arguments.metrics_file)
+
+    # инициализация инструментов распознования речи
+    recognizer = speech_recognition.Recognizer()
+    recognizer.operation_timeout = 10  # зависший запрос к Google не занимает поток пула распознавания бесконечно
+    noise_estimator = NoiseEstimator(recognizer)
+    voice_activity_detector = VoiceActivityDetector(recognizer)
 
     # данные пользователя
-    person = OwnerPerson
-    person.name = "Matvey"
-    person.home_city = "Lipetsk"
-    person.native_language = 'ru'
-    person.target_language = 'en'
+    owner_person = OwnerPerson()
+    owner_person.name = "Matvey"
+    owner_person.home_city = "Lipetsk"
+    owner_person.native_language = 'ru'
+    owner_person.target_language = 'en'
 
     # данные помощника
-    assistant = VoiceAssistant()
-    assistant.name = "Alice"
-    assistant.sex = "female"
-    assistant.speech_language = "ru"
+    assistant_settings = VoiceAssistant()
+    assistant_settings.name = "Alice"
+    assistant_settings.sex = "female"
+    assistant_settings.speech_language = "ru"
 
-    # установка голоса по умолчанию
-    setup_assistant_voice()
+    # сессия локального пользователя (на сервере - шаблон для сессий удалённых пользователей)
+    default_session = AssistantSession(owner_person, assistant_settings, speak_locally=not arguments.serve)
+
+    # реестр оффлайн-моделей (модель текущего языка заранее загружается в фоне)
+    vosk_models = VoskModelRegistry()
+    vosk_models.switch_language(assistant.speech_language)
+
+    # выбор способа распознавания (Google и Vosk параллельно, Google отключается после нескольких неудач подряд)
+    recognition_strategy = RecognitionStrategy(assistant.recognition_mode)
 
     # добавление возможностей перевода фраз (из заготовленного файла)
     translator = Translation()
@@ -474,18 +3518,61 @@ if __name__ == "__main__":
     # загрузка информации из .env-файла (там лежит API-ключ для OpenWeatherMap)
     load_dotenv()
 
+    # использование API-ключа, помещённого в .env-файл по примеру WEATHER_API_KEY = "01234abcd.....",
+    # погода в родном городе запрашивается заранее (чтобы первый вопрос о погоде не ждал сеть)
+    weather_service = WeatherService(os.getenv("9341ce5d5741e2c7e7ed34b75a4384a5"),
+                                     ttl=float(os.getenv("WEATHER_CACHE_TTL", 600)))
+    weather_service.prefetch(person.home_city)
+
+    # кэш описаний из Wikipedia (повторные вопросы обрабатываются без сети)
+    wikipedia_summaries = WikipediaSummaries(PersistentCache(os.path.join("cache", "wikipedia.sqlite3")))
+
+    # общий переводчик с кэшем переводов
+    text_translator = TextTranslator(PersistentCache(os.path.join("cache", "translations.sqlite3")))
+
+    # счётчики компонентов выгружаются вместе с задержками этапов (--metrics-file, /metrics, /metrics.json)
+    stage_metrics.register_stats("vosk_models", vosk_models.get_stats)
+    stage_metrics.register_stats("recognition", recognition_strategy.get_stats)
+    stage_metrics.register_stats("noise_estimator", noise_estimator.get_stats)
+    stage_metrics.register_stats("voice_activity_detector", voice_activity_detector.get_stats)
+    stage_metrics.register_stats("weather", weather_service.get_stats)
+    stage_metrics.register_stats("wikipedia_cache", wikipedia_summaries.cache.get_stats)
+    stage_metrics.register_stats("translation_cache", text_translator.cache.get_stats)
+
+    if arguments.serve:
+        # распознаватели, кэши и пулы навыков общие, у каждого пользователя - своя сессия
+        sessions = SessionRegistry()
+        run_server(arguments.host, arguments.port)
+        quit()
+
+    # инициализация инструментов ввода и синтеза речи
+    microphone = speech_recognition.Microphone()
+    ttsEngine = pyttsx3.init()
+
+    # установка голоса по умолчанию
+    setup_assistant_voice()
+
+    if arguments.metrics_port:
+        start_metrics_server(arguments.host, arguments.metrics_port)
+
+    # кэш синтезированных неизменных фраз (недостающие фразы синтезируются в фоне)
+    speech_cache = SpeechCache()
+    stage_metrics.register_stats("speech_cache", speech_cache.get_stats)
+    speech_cache.prerender_async(get_prerendered_phrases())
+
+    if assistant.use_pipeline:
+        # запись, распознавание и выполнение команд выполняются параллельно
+        assistant_pipeline = AssistantPipeline()
+        stage_metrics.register_stats("pipeline", assistant_pipeline.get_stats)
+        assistant_pipeline.run()
+        quit()
+
     while True:
-        # старт записи речи с последующим выводом распознанной речи и удалением записанного в микрофон аудио
+        # старт записи речи с последующим выводом распознанной речи (аудио хранится только в памяти)
         voice_input = record_and_recognize_audio()
-        os.remove("microphone-results.wav")
         print(colored(voice_input, "blue"))
-
-        # отделение комманд от дополнительной информации (аргументов)
-        voice_input = voice_input.split(" ")
-        command = voice_input[0]
-        command_options = [str(input_part) for input_part in voice_input[1:len(voice_input)]]
-        execute_command_with_name(command, command_options)
+        execute_command(voice_input)
 
 # TODO food order
 # TODO recommend film by rating/genre (use recommendation system project)
-#  как насчёт "название фильма"? Вот его описание:.....
\ No newline at end of file
+#  как насчёт "название фильма"? Вот его описание:.....